@@ -53,7 +53,9 @@ class MultiHeadAttention(nn.Module):
 
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, event_length=None):
+    def forward(self, x, event_length=None, segments=None):
+        if segments is not None:
+            return self._forward_packed(x, event_length, segments)
         batch_size, seq_len, _ = x.shape
 
         # Project input into Q, K, V
@@ -92,3 +94,30 @@ class MultiHeadAttention(nn.Module):
 
         attention_output = self.dropout(attention_output)
         return attention_output
+
+    def _forward_packed(self, x, event_length, segments):
+        """Packed (total_doms, d_model) input: the projections see real DOMs only.
+
+        The attention head runs on the segments padded to the longest one, masked
+        per event, i.e. block-diagonal attention.
+        """
+        qkv = self.qkv_proj(x).view(-1, self.n_heads, 3 * self.head_dim)
+        qkv = segments.pad(qkv)  # (batch, max_length, heads, 3 * head_dim)
+        qkv = qkv.permute(0, 2, 1, 3)  # (batch, heads, seq, 3 * head_dim)
+        q, k, v = qkv.chunk(3, dim=-1)
+
+        if self.positional_encoding_type == PositionalEncodingType.ROPE:
+            self.rope = self.rope.to(q.device)
+            q, k = self.rope.rotate_queries_and_keys(q, k)
+
+        attention_output = self.attention_head(q, k, v, event_length)
+        if torch.isnan(attention_output).any():
+            print(f"🚨 NaN detected AFTER attention!")
+            raise ValueError("NaN detected in attention output!")
+
+        # concatenate heads and drop the padding again
+        attention_output = segments.unpad(attention_output.permute(0, 2, 1, 3))
+        attention_output = self.out_proj(attention_output.reshape(-1, self.d_model))
+
+        attention_output = self.dropout(attention_output)
+        return attention_output
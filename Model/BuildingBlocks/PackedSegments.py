@@ -0,0 +1,33 @@
+import torch
+import torch.nn.functional as F
+
+
+class PackedSegments:
+    """Layout of a packed batch: events back to back as (total_doms, ...) rows.
+
+    Built once per forward pass from the per-event lengths and shared by every layer.
+    """
+
+    def __init__(self, lengths: torch.Tensor):
+        # lengths shape: (batch_size,)
+        self.lengths = lengths
+        self.batch_size = lengths.size(0)
+        self.cu_seqlens = F.pad(torch.cumsum(lengths, dim=0), (1, 0))
+        # (total_doms,) event of each row and position of the row within its event
+        self.batch_idx = torch.repeat_interleave(
+            torch.arange(self.batch_size, device=lengths.device), lengths
+        )
+        self.positions = torch.arange(
+            self.batch_idx.size(0), device=lengths.device
+        ) - torch.repeat_interleave(self.cu_seqlens[:-1], lengths)
+        self.max_length = int(lengths.max()) if self.batch_size > 0 else 0
+
+    def pad(self, x: torch.Tensor) -> torch.Tensor:
+        """(total_doms, ...) -> (batch_size, max_length, ...), zero padded."""
+        padded = x.new_zeros((self.batch_size, self.max_length, *x.shape[1:]))
+        padded[self.batch_idx, self.positions] = x
+        return padded
+
+    def unpad(self, padded: torch.Tensor) -> torch.Tensor:
+        """(batch_size, max_length, ...) -> (total_doms, ...)."""
+        return padded[self.batch_idx, self.positions]
@@ -7,7 +7,9 @@ class Pooling(nn.Module):
         super().__init__()
         self.pooling_type = pooling_type
 
-    def forward(self, x, mask=None):
+    def forward(self, x, mask=None, segments=None):
+        if segments is not None:
+            return self._forward_packed(x, segments)
         if mask is not None:
             # x shape is (batch_size, seq_len, d_model)
             mask = mask.unsqueeze(-1)  # Expands to (batch_size, seq_len, 1) to match x
@@ -38,3 +40,22 @@ class Pooling(nn.Module):
             return torch.cat([x.mean(dim=1), x.max(dim=1)[0]], dim=-1)
         else:
             raise ValueError(f"Unknown pooling type: {self.pooling_type}")
+
+    def _forward_packed(self, x, segments):
+        # x shape is (total_doms, d_model); every row is a real DOM
+        index = segments.batch_idx
+        lengths = segments.lengths.unsqueeze(-1).to(x.dtype)
+        mean_pooled = x.new_zeros((segments.batch_size, x.size(1))).index_add_(
+            0, index, x
+        ) / (lengths + 1e-6)
+        if self.pooling_type == "mean":
+            return mean_pooled
+        max_pooled = x.new_full((segments.batch_size, x.size(1)), -1e9).index_reduce_(
+            0, index, x, "amax"
+        )
+        if self.pooling_type == "max":
+            return max_pooled
+        elif self.pooling_type == "synthetic":
+            return torch.cat([mean_pooled, max_pooled], dim=-1)
+        else:
+            raise ValueError(f"Unknown pooling type: {self.pooling_type}")
@@ -42,9 +42,9 @@ class EncoderBlock(nn.Module):
 
         self.norm_ffn = nn.LayerNorm(self.d_model)
 
-    def forward(self, x, event_length=None):
-        # x shape: (batch_size, seq_len, d_model)
-        attn_output = self.attention(x, event_length=event_length)
+    def forward(self, x, event_length=None, segments=None):
+        # x shape: (batch_size, seq_len, d_model), or (total_doms, d_model) when packed
+        attn_output = self.attention(x, event_length=event_length, segments=segments)
         if torch.isnan(x).any():
             print(f"🚨 NaN detected AFTER ATTENTION in layer {self.layer_idx}!")
             print(f"🔍 Min/Max: {x.min().item()} / {x.max().item()}")
@@ -8,6 +8,7 @@ from pytorch_lightning import LightningModule
 
 from .EncoderBlock import EncoderBlock
 from .BuildingBlocks.Pooling import Pooling
+from .BuildingBlocks.PackedSegments import PackedSegments
 from .BuildingBlocks.OutputProjection import OutputProjection
 from Enum.AttentionType import AttentionType
 from Enum.PositionalEncodingType import PositionalEncodingType
@@ -90,6 +91,27 @@ class FlavourClassificationTransformerEncoder(LightningModule):
         )
 
     def forward(self, x, target=None, mask=None, event_length=None):
+        if x.dim() == 2:
+            # Packed batch: (total_doms, d_input), events back to back
+            x = self._encode_packed(x, event_length)
+        else:
+            x = self._encode_padded(x, event_length)
+        # x shape: (batch_size, d_model)
+
+        model_output = self.classification_output_layer(x)
+        # output shape: (batch_size, num_classes)
+        # squeezed output model_output.squeeze() shape:
+
+        loss = self.compute_loss(model_output.squeeze(), target.squeeze())
+
+        if torch.isnan(x).any():
+            print("Feature stats:", x.min().item(), x.max().item())
+            print("⚠️ NaN detected in Transformer Encoder output!")
+            raise ValueError("NaN detected before classification layer!")
+
+        return loss, model_output
+
+    def _encode_padded(self, x, event_length):
         batch_size, seq_len, input_dim = x.size()
 
         x = self.input_projection(x).to(x.device)
@@ -114,19 +136,21 @@ class FlavourClassificationTransformerEncoder(LightningModule):
 
         x = self.pooling(x, mask)
         # x shape: (batch_size, d_model)
+        return x
 
-        model_output = self.classification_output_layer(x)
-        # output shape: (batch_size, num_classes)
-        # squeezed output model_output.squeeze() shape:
+    def _encode_packed(self, x, event_length):
+        """Position-wise layers see real DOMs only; `event_length` holds the segment lengths."""
+        segments = PackedSegments(event_length)
 
-        loss = self.compute_loss(model_output.squeeze(), target.squeeze())
+        x = self.input_projection(x)
+        # x shape: (total_doms, d_model)
+        if self.positional_encoding_type == PositionalEncodingType.ABSOLUTE:
+            x = x + self.position_embedding(segments.positions)
 
-        if torch.isnan(x).any():
-            print("Feature stats:", x.min().item(), x.max().item())
-            print("⚠️ NaN detected in Transformer Encoder output!")
-            raise ValueError("NaN detected before classification layer!")
+        for encoder in self.encoder_blocks:
+            x = encoder(x, event_length=event_length, segments=segments)
 
-        return loss, model_output
+        return self.pooling(x, segments=segments)
 
     def compute_loss(self, output, target):
         loss = None
@@ -201,7 +225,7 @@ class FlavourClassificationTransformerEncoder(LightningModule):
         )
         if self.loss_type == LossType.TAUPURITYMSE:
             probs = self.compute_probs(model_output)
-            tau_purity = self._get_tau_purity(probs, target, x.size(0))
+            tau_purity = self._get_tau_purity(probs, target, target.size(0))
             mse_loss = F.mse_loss(model_output, target)
             self.log("train_mse", mse_loss, prog_bar=True, on_step=False, on_epoch=True)
             self.log(
@@ -232,7 +256,7 @@ class FlavourClassificationTransformerEncoder(LightningModule):
             probs = self.compute_probs(model_output)
             how_many = 12
             print("\nmodel_output    \t\t prob \t\t prediction \t target")
-            for i in range(min(how_many, x.size(0))):
+            for i in range(min(how_many, target.size(0))):
                 pred_one_hot = [
                     1 if j == predicted_labels[i].item() else 0
                     for j in range(self.num_classes)
@@ -275,7 +299,7 @@ class FlavourClassificationTransformerEncoder(LightningModule):
 
         if self.loss_type == LossType.TAUPURITYMSE:
             probs = self.compute_probs(model_output)
-            tau_purity = self._get_tau_purity(probs, target, x.size(0))
+            tau_purity = self._get_tau_purity(probs, target, target.size(0))
             mse_loss = F.mse_loss(model_output, target)
             self.log("val_mse", mse_loss, prog_bar=True, on_step=False, on_epoch=True)
             self.log(
@@ -296,7 +320,7 @@ class FlavourClassificationTransformerEncoder(LightningModule):
             probs = self.compute_probs(model_output)
             how_many = 12
             print("\nmodel_output    \t\t prob \t\t prediction \t target")
-            for i in range(min(how_many, x.size(0))):
+            for i in range(min(how_many, target.size(0))):
                 pred_one_hot = [
                     1 if j == predicted_labels[i].item() else 0
                     for j in range(self.num_classes)
@@ -325,17 +349,21 @@ class FlavourClassificationTransformerEncoder(LightningModule):
         return loss
 
     def predict_step(self, batch, batch_idx):
-        x, target, event_length = batch
+        x, target, event_length = batch[:3]
         _, model_outputs = self(
             x, target=target, event_length=event_length
         )  # <- fix here
         preds = torch.argmax(model_outputs, dim=-1)
 
-        return {
+        outputs = {
             "target": target.cpu(),  # fixed key name for consistency
             "pred_class": preds.cpu().numpy(),
             "model_outputs": model_outputs.cpu().numpy(),
         }
+        if len(batch) == 4:
+            # ✅ Analysis truth carried by the collate, row-aligned with the outputs
+            outputs["analysis"] = batch[3].cpu().numpy()
+        return outputs
 
     def test_step(self, batch, batch_idx):
         x, target, event_length, analysis = batch
@@ -368,7 +396,7 @@ class FlavourClassificationTransformerEncoder(LightningModule):
             softmax_model_output = F.softmax(model_output, dim=1)
             how_many = 6
             print("\nmodel_output    \t softmax(model_output) \t prediction \t target")
-            for i in range(min(how_many, x.size(0))):
+            for i in range(min(how_many, target.size(0))):
                 pred_one_hot = [
                     1 if j == predicted_labels[i].item() else 0
                     for j in range(self.num_classes)
@@ -0,0 +1,275 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class EventIndex:
+    """Columnar event index: one typed NumPy array per field, one entry per event.
+
+    `truth_files` lists the truth files the index was built from, which is a
+    leading run of the directory in part-number order when the build stopped early.
+    """
+
+    DEFAULT_INDEX_THREADS = min(8, os.cpu_count() or 1)
+
+    ANALYSIS = [
+        "energy",
+        "zenith",
+        "azimuth",
+        "elasticity",
+        "dbang_decay_length",
+        "track_length",
+        "energy_GNHighestEDaughter",
+        "energy_GNHighestEInIceParticle",
+    ]
+    COLUMNS = {
+        "file_id": np.int32,  # position of the truth file in `truth_files`
+        "row": np.int64,  # row of the event within its truth file
+        "shard_no": np.int32,
+        "offset": np.int64,
+        "N_doms": np.int32,
+        "event_no": np.int64,
+        "pid": np.int32,
+        **{name: np.float64 for name in ANALYSIS},
+    }
+
+    def __init__(self, truth_files: list, **columns) -> None:
+        self.truth_files = list(truth_files)
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+
+    @staticmethod
+    def part_number(filepath: str) -> float:
+        """Extracts part number from `truth_X.parquet` (only uses filename)."""
+        filename = os.path.basename(filepath)
+        parts = filename.split("_")
+        if len(parts) < 2 or not parts[1].split(".")[0].isdigit():
+            return float("inf")  # Push invalid files to the end of sorting
+        return int(parts[1].split(".")[0])
+
+    @classmethod
+    def fingerprint(cls, truth_files: list, key=()) -> str:
+        """Hashes the truth file list, sizes, mtimes and index layout together with `key`."""
+        entries = []
+        for truth_file in truth_files:
+            stat = os.stat(truth_file)
+            entries.append([truth_file, stat.st_size, stat.st_mtime_ns])
+        payload = json.dumps(
+            {"files": entries, "columns": list(cls.COLUMNS), "key": list(key)}
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @staticmethod
+    def cache_file(truth_file_dir: str, cache_dir: str = None, tag: str = "") -> str:
+        """Sidecar next to the truth files, or a per-directory file in `cache_dir`."""
+        if cache_dir is None:
+            return os.path.join(truth_file_dir, f".event_index_{tag}.npz")
+        dir_hash = hashlib.sha1(os.path.abspath(truth_file_dir).encode()).hexdigest()
+        name = (
+            f"event_index_{tag}_{os.path.basename(truth_file_dir)}_{dir_hash[:8]}.npz"
+        )
+        return os.path.join(cache_dir, name)
+
+    @classmethod
+    def load(cls, cache_file: str, truth_files: list, n_events: int, key=()):
+        """Returns the cached index, or None if missing, unreadable, stale or too short.
+
+        The cache covers a leading run of `truth_files`; it is reused as long as those
+        files are unchanged and they hold at least `n_events` events, or are all there is.
+        """
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            with np.load(cache_file, allow_pickle=False) as cached:
+                cached_files = cached["truth_files"].tolist()
+                if cached_files != truth_files[: len(cached_files)]:
+                    return None
+                if str(cached["fingerprint"]) != cls.fingerprint(cached_files, key):
+                    return None
+                event_index = cls(
+                    cached_files, **{name: cached[name] for name in cls.COLUMNS}
+                )
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable event index cache {cache_file}: {e}")
+            return None
+        if len(event_index) < n_events and len(cached_files) < len(truth_files):
+            return None
+        return event_index
+
+    @classmethod
+    def read(cls, index_file: str) -> "EventIndex":
+        """Loads a saved index as is, without checking it against the truth files."""
+        with np.load(index_file, allow_pickle=False) as saved:
+            return cls(
+                saved["truth_files"].tolist(),
+                **{name: saved[name] for name in cls.COLUMNS},
+            )
+
+    def write(self, index_file: str, key=()) -> None:
+        """Writes the index and its fingerprint atomically to `index_file`."""
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            with open(tmp_file, "wb") as f:
+                np.savez(
+                    f,
+                    fingerprint=np.array(self.fingerprint(self.truth_files, key)),
+                    truth_files=np.array(self.truth_files, dtype=str),
+                    **{name: getattr(self, name) for name in self.COLUMNS},
+                )
+            os.replace(tmp_file, index_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def save(self, cache_file: str, key=()) -> None:
+        """Writes the index cache; failures (e.g. read-only data) only warn."""
+        try:
+            self.write(cache_file, key)
+        except OSError as e:
+            print(f"⚠️ Could not write event index cache {cache_file}: {e}")
+
+    @classmethod
+    def load_or_build(
+        cls, cache_file: str, truth_files: list, build, n_events: int, key=()
+    ) -> "EventIndex":
+        """Loads the index from `cache_file` if it is still valid, else builds and saves it."""
+        event_index = cls.load(cache_file, truth_files, n_events, key)
+        if event_index is not None:
+            print(f"✅ Event index loaded from cache: {cache_file}")
+            return event_index
+        event_index = build()
+        event_index.save(cache_file, key)
+        return event_index
+
+    @staticmethod
+    def leading_files(truth_files: list, n_events: int) -> list:
+        """Shortest leading run of `truth_files` whose footer row counts reach `n_events`."""
+        needed, n_rows = [], 0
+        for truth_file in truth_files:
+            if n_rows >= n_events:
+                break
+            needed.append(truth_file)
+            n_rows += pq.read_metadata(truth_file).num_rows
+        return needed
+
+    @classmethod
+    def empty(cls, truth_files: list) -> "EventIndex":
+        return cls(
+            truth_files,
+            **{name: np.empty(0, dtype=dtype) for name, dtype in cls.COLUMNS.items()},
+        )
+
+    @classmethod
+    def from_truth_table(
+        cls, truth_files: list, file_id: int, truth_table: pa.Table
+    ) -> "EventIndex":
+        """Index every row of one truth table with whole-column conversions."""
+        n_rows = truth_table.num_rows
+        columns = {
+            name: truth_table.column(name).to_numpy()
+            for name in cls.COLUMNS
+            if name not in ("file_id", "row")
+        }
+        columns["file_id"] = np.full(n_rows, file_id)
+        columns["row"] = np.arange(n_rows)
+        return cls(truth_files, **columns)
+
+    @classmethod
+    def scan_truth_file(
+        cls, truth_files: list, file_id: int, columns: list, selection=None
+    ) -> "EventIndex":
+        """Indexes the rows of one truth file inside the truth ranges of `selection`."""
+        read_columns = list(columns)
+        if selection is not None:
+            read_columns += [c for c in selection.truth_columns if c not in columns]
+        truth_table = pq.read_table(
+            truth_files[file_id], columns=read_columns, memory_map=True
+        )
+        file_index = cls.from_truth_table(truth_files, file_id, truth_table)
+        if selection is None or not selection.truth_ranges:
+            return file_index
+        return file_index.take(np.flatnonzero(selection.mask(truth_table)))
+
+    @classmethod
+    def iter_truth_files(
+        cls, truth_files: list, columns: list, selection=None, n_threads: int = None
+    ):
+        """Yields the index of every truth file in order, reading `n_threads` files at a time.
+
+        The files of a wave are decoded concurrently (Parquet decode releases the GIL)
+        and yielded in file order, so the result does not depend on the thread count;
+        a caller that stops early wastes at most the rest of one wave.
+        """
+        n_threads = max(1, n_threads or cls.DEFAULT_INDEX_THREADS)
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            for start in range(0, len(truth_files), n_threads):
+                file_ids = range(start, min(start + n_threads, len(truth_files)))
+                yield from executor.map(
+                    lambda file_id: cls.scan_truth_file(
+                        truth_files, file_id, columns, selection
+                    ),
+                    file_ids,
+                )
+
+    @classmethod
+    def concatenate(cls, indices: list, truth_files: list) -> "EventIndex":
+        if not indices:
+            return cls.empty(truth_files)
+        return cls(
+            truth_files,
+            **{
+                name: np.concatenate([getattr(index, name) for index in indices])
+                for name in cls.COLUMNS
+            },
+        )
+
+    def __len__(self) -> int:
+        return len(self.event_no)
+
+    def take(self, positions) -> "EventIndex":
+        """Returns a new index holding the entries at `positions` (slice or array)."""
+        return EventIndex(
+            self.truth_files,
+            **{name: getattr(self, name)[positions] for name in self.COLUMNS},
+        )
+
+    def head(self, n: int) -> "EventIndex":
+        return self.take(slice(0, n))
+
+    def unique_by_event_no(self) -> "EventIndex":
+        """Keeps the first occurrence of every event_no, sorted by event_no."""
+        _, first_positions = np.unique(self.event_no, return_index=True)
+        return self.take(first_positions)
+
+    def event(self, idx: int) -> tuple:
+        """Returns (event_no, truth_file, row, shard_no, offset, N_doms) as Python scalars."""
+        return (
+            int(self.event_no[idx]),
+            self.truth_files[self.file_id[idx]],
+            int(self.row[idx]),
+            int(self.shard_no[idx]),
+            int(self.offset[idx]),
+            int(self.N_doms[idx]),
+        )
+
+    def analysis_truth(self, indices, columns: list) -> np.ndarray:
+        """Returns the values of `columns` for the events at `indices` as a float64 (n, k) array."""
+        return np.column_stack(
+            [getattr(self, name)[indices] for name in columns]
+        ).astype(np.float64)
+
+    def group_by_shard(self, indices: np.ndarray) -> list:
+        """Splits positions into `indices` by feature shard (file_id, shard_no)."""
+        if len(indices) == 0:
+            return []
+        keys = np.column_stack([self.file_id[indices], self.shard_no[indices]])
+        _, groups = np.unique(keys, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        order = np.argsort(groups, kind="stable")
+        boundaries = np.flatnonzero(np.diff(groups[order])) + 1
+        return np.split(order, boundaries)
@@ -0,0 +1,49 @@
+import pyarrow.parquet as pq
+
+
+class FeatureSchema:
+    """Column layout of the PMTfied shards, read from a Parquet footer only.
+
+    `column_names` are the feature columns in the order they appear in the
+    feature tensors, i.e. with the ID columns dropped.
+    """
+
+    ID_COLUMNS = ["event_no", "original_event_no"]
+
+    _schemas = {}  # feature file -> FeatureSchema, per process
+
+    def __init__(self, shard_column_names: list) -> None:
+        self.shard_column_names = list(shard_column_names)
+        self.id_columns = [
+            col for col in self.ID_COLUMNS if col in self.shard_column_names
+        ]
+        self.column_names = [
+            col for col in self.shard_column_names if col not in self.ID_COLUMNS
+        ]
+
+    @classmethod
+    def from_file(cls, feature_file: str) -> "FeatureSchema":
+        """Reads the schema of `feature_file` once; later calls are served from memory."""
+        schema = cls._schemas.get(feature_file)
+        if schema is None:
+            schema = cls(pq.read_schema(feature_file).names)
+            cls._schemas[feature_file] = schema
+        return schema
+
+    def select(self, columns: list) -> "FeatureSchema":
+        """Layout of a read restricted to the ID columns and `columns`, in that order."""
+        missing = [col for col in columns if col not in self.column_names]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in feature set.")
+        return FeatureSchema(self.id_columns + list(columns))
+
+    @property
+    def d_input(self) -> int:
+        return len(self.column_names)
+
+    def index_of(self, column: str) -> int:
+        """Position of `column` in the feature tensors."""
+        try:
+            return self.column_names.index(column)
+        except ValueError:
+            raise KeyError(f"Column '{column}' not found in feature set.")
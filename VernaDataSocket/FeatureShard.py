@@ -0,0 +1,98 @@
+import numpy as np
+import pyarrow as pa
+
+
+class FeatureShard:
+    """One PMTfied shard, normalised once: float32 DOM rows plus the rows holding NaNs.
+
+    Events are plain slices `features[offset : offset + N_doms]`; an event is invalid
+    when any of its rows held a NaN before or after normalisation. A shard can also
+    hold only rows `row_start` onwards of its file (e.g. one row group); offsets
+    stay relative to the file.
+    """
+
+    def __init__(
+        self,
+        features: np.ndarray,
+        column_names: list,
+        invalid_rows: np.ndarray,
+        row_start: int = 0,
+    ) -> None:
+        self.features = features
+        self.column_names = column_names  # feature columns, ID columns dropped
+        self.invalid_rows = invalid_rows  # sorted row numbers within the file
+        self.row_start = row_start
+        self.row_stop = row_start + len(features)
+        self.nbytes = features.nbytes
+
+    @classmethod
+    def from_table(
+        cls, table: pa.Table, normaliser, id_columns: list, source: str = ""
+    ) -> "FeatureShard":
+        """Normalises and NaN-scans a whole shard table, reporting bad events in bulk."""
+        feature_table = table.drop(id_columns)
+        features = np.empty(
+            (feature_table.num_rows, feature_table.num_columns), dtype=np.float64
+        )
+        for col_idx, column in enumerate(feature_table.columns):
+            features[:, col_idx] = column.to_numpy()
+
+        nan_rows = np.isnan(features).any(axis=1)
+        features = normaliser(features, feature_table.column_names)
+        introduced_rows = np.isnan(features).any(axis=1) & ~nan_rows
+        invalid_rows = np.flatnonzero(nan_rows | introduced_rows)
+
+        if len(invalid_rows):
+            event_nos = table.column("event_no").to_numpy()
+            nan_events = np.unique(event_nos[nan_rows])
+            introduced_events = np.setdiff1d(
+                np.unique(event_nos[introduced_rows]), nan_events
+            )
+            print(
+                f"⚠️ {len(nan_events)} events with NaN and {len(introduced_events)} "
+                f"with NaN introduced by normalisation in {source}: "
+                f"{np.concatenate([nan_events, introduced_events]).tolist()}"
+            )
+        return cls(
+            features.astype(np.float32),
+            feature_table.column_names,
+            invalid_rows,
+        )
+
+    def split(self, row_starts: list, row_counts: list) -> list:
+        """Splits a shard read from several row groups into one shard per row group.
+
+        `row_starts` and `row_counts` are the first file row and the size of each row
+        group, in the order they were read. With more than one row group every piece
+        gets its own copy, so a cache that evicts one piece frees its bytes.
+        """
+        pieces, row = [], 0
+        for row_start, n_rows in zip(row_starts, row_counts):
+            rows = slice(row, row + n_rows)
+            features = self.features[rows]
+            if len(row_counts) > 1:
+                features = features.copy()
+            in_piece = (self.invalid_rows >= row) & (self.invalid_rows < row + n_rows)
+            pieces.append(
+                FeatureShard(
+                    features,
+                    self.column_names,
+                    self.invalid_rows[in_piece] - row + row_start,
+                    row_start=row_start,
+                )
+            )
+            row += n_rows
+        return pieces
+
+    def valid_events(self, offsets: np.ndarray, N_doms: np.ndarray) -> np.ndarray:
+        """Validity bitmap of the events at `offsets`: True if none of their rows hold a NaN."""
+        if len(self.invalid_rows) == 0:
+            return np.ones(len(offsets), dtype=bool)
+        first = np.searchsorted(self.invalid_rows, offsets)
+        end = np.searchsorted(self.invalid_rows, offsets + N_doms)
+        return first == end
+
+    def event(self, offset: int, N_doms: int) -> np.ndarray:
+        """DOM rows of one event as a view into the shard; callers must not modify it."""
+        start = offset - self.row_start
+        return self.features[start : start + N_doms]
@@ -0,0 +1,307 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow.parquet as pq
+from .FeatureShard import FeatureShard
+from .RowGroupShard import RowGroupShard
+from .FeatureSchema import FeatureSchema
+from .PseudoNormaliser import PseudoNormaliser
+
+
+class FeatureShardCache:
+    """Per-process LRU cache of normalised `PMTfied_{shard}.parquet` shards bounded by a byte budget.
+
+    Every dataset in a process (the flavour datasets and the noise dataset alike)
+    goes through the same instance, so round-robin interleaving across datasets
+    does not evict and re-read shards that are still in use. Shards are normalised
+    and NaN-scanned once when they enter the cache.
+
+    `prefetch` reads shards ahead on a small thread pool (Parquet decode and the
+    NumPy normalisation release the GIL), so a shard the sampler reaches next is
+    usually cached, or already being read, by the time `get` asks for it; a `get`
+    that has to wait for such a read counts as a prefetch wait, not as a hit.
+
+    `get_rows` reads only the row groups that given events overlap (row group
+    bounds come from the Parquet footer) and caches them one by one, for sparse
+    access such as an evaluation split where most of each shard is never used;
+    `prefetch_rows` reads such row groups ahead in the same way.
+    """
+
+    DEFAULT_MAX_BYTES = 4 * 1024**3
+    PREFETCH_THREADS = 2
+    SHARED = False  # True when the budget is shared by all processes of a node
+
+    _instance = None
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.normaliser = PseudoNormaliser()
+        self._shards = OrderedDict()  # shard key, or (shard key, row group)
+        self._row_group_bounds = (
+            {}
+        )  # feature_file -> first row of each row group + N rows
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self.prefetch_waits = 0  # gets that waited on a read still in flight
+        self._reset_threads()
+
+    def _reset_threads(self) -> None:
+        # A forked DataLoader worker inherits the parent's cache but not its threads
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending = {}  # feature_file -> Future of a read in flight
+        self._executor = None
+
+    @classmethod
+    def instance(cls, max_bytes: int = None) -> "FeatureShardCache":
+        """Returns the cache shared within this process, resizing it if `max_bytes` is given."""
+        if cls._instance is None:
+            cls._instance = cls()
+        if max_bytes is not None and max_bytes != cls._instance.max_bytes:
+            with cls._instance._lock:
+                cls._instance.max_bytes = max_bytes
+                cls._instance._evict()
+        return cls._instance
+
+    @classmethod
+    def install(cls, cache: "FeatureShardCache") -> None:
+        """Makes `cache` the instance of this process and of the workers forked from it."""
+        cls._instance = cache
+
+    @staticmethod
+    def _key(feature_file: str, columns: list = None):
+        """Cache key of a shard read with `columns` (None: every column)."""
+        return feature_file if columns is None else (feature_file, tuple(columns))
+
+    def get(self, feature_file: str, columns: list = None) -> FeatureShard:
+        """Returns the normalised shard of `feature_file`, reading it on a miss."""
+        if self._pid != os.getpid():
+            self._reset_threads()
+        key = self._key(feature_file, columns)
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                self.hits += 1
+                return shard
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.prefetch_waits += 1
+            else:
+                self.misses += 1
+
+        if pending is not None:
+            # ✅ Being prefetched: wait for that read instead of starting another
+            return pending.result()
+        return self._insert(key, self._read(feature_file, columns))
+
+    def get_rows(
+        self,
+        feature_file: str,
+        offsets: np.ndarray,
+        N_doms: np.ndarray,
+        columns: list = None,
+    ) -> RowGroupShard:
+        """Returns the row groups of `feature_file` holding the events at `offsets`."""
+        if self._pid != os.getpid():
+            self._reset_threads()
+        bounds, row_groups = self._row_groups(feature_file, offsets, N_doms)
+        key = self._key(feature_file, columns)
+        blocks, pending, missing = {}, {}, []
+        with self._lock:
+            for row_group in row_groups:
+                block = self._shards.get((key, row_group))
+                if block is not None:
+                    self._shards.move_to_end((key, row_group))
+                    blocks[row_group] = block
+                elif (key, row_group) in self._pending:
+                    pending[row_group] = self._pending[(key, row_group)]
+                else:
+                    missing.append(row_group)
+            self.hits += len(blocks)
+            self.prefetch_waits += len(pending)
+            self.misses += len(missing)
+        if missing:
+            blocks.update(
+                self._read_row_groups(feature_file, key, bounds, missing, columns)
+            )
+        for row_group, future in pending.items():
+            # ✅ Being prefetched: wait for that read instead of starting another
+            blocks[row_group] = future.result()[row_group]
+        return RowGroupShard([blocks[row_group] for row_group in row_groups])
+
+    def _row_groups(
+        self, feature_file: str, offsets: np.ndarray, N_doms: np.ndarray
+    ) -> tuple:
+        """Row group bounds of `feature_file` and the row groups the events at `offsets` overlap."""
+        bounds = self._row_group_bounds.get(feature_file)
+        if bounds is None:
+            metadata = pq.read_metadata(feature_file)
+            row_counts = [
+                metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)
+            ]
+            bounds = np.concatenate([[0], np.cumsum(row_counts)])
+            self._row_group_bounds[feature_file] = bounds
+
+        first = np.searchsorted(bounds, offsets, side="right") - 1
+        last = np.searchsorted(bounds, offsets + np.maximum(N_doms, 1) - 1, "right") - 1
+        row_groups = np.unique(
+            np.concatenate([np.arange(a, b + 1) for a, b in zip(first, last)])
+        ).tolist()
+        return bounds, row_groups
+
+    def _read_row_groups(
+        self,
+        feature_file: str,
+        key,
+        bounds: np.ndarray,
+        row_groups: list,
+        columns: list,
+        prefetched: bool = False,
+    ) -> dict:
+        """Reads and caches `row_groups` of `feature_file`, returning {row group: block}."""
+        # ✅ One read and one normalisation pass for all of them
+        table = pq.ParquetFile(feature_file, memory_map=True).read_row_groups(
+            row_groups, columns=columns
+        )
+        shard = FeatureShard.from_table(
+            table, self.normaliser, FeatureSchema.ID_COLUMNS, source=feature_file
+        )
+        pieces = shard.split(
+            bounds[row_groups].tolist(), np.diff(bounds)[row_groups].tolist()
+        )
+        return {
+            row_group: self._insert((key, row_group), block, prefetched)
+            for row_group, block in zip(row_groups, pieces)
+        }
+
+    def prefetch(self, feature_files: list, columns: list = None) -> None:
+        """Starts background reads of the `feature_files` that are neither cached nor in flight."""
+        if self._pid != os.getpid():
+            self._reset_threads()
+        with self._lock:
+            for feature_file in feature_files:
+                key = self._key(feature_file, columns)
+                if key in self._shards or key in self._pending:
+                    continue
+                self._pending[key] = self._prefetch_executor().submit(
+                    self._prefetch_one, feature_file, columns
+                )
+
+    def prefetch_rows(
+        self,
+        feature_file: str,
+        offsets: np.ndarray,
+        N_doms: np.ndarray,
+        columns: list = None,
+    ) -> None:
+        """Starts a background read of the row groups of `feature_file` that the events at
+        `offsets` need and that are neither cached nor in flight, as `get_rows` reads them.
+        """
+        if self._pid != os.getpid():
+            self._reset_threads()
+        bounds, row_groups = self._row_groups(feature_file, offsets, N_doms)
+        key = self._key(feature_file, columns)
+        with self._lock:
+            missing = [
+                row_group
+                for row_group in row_groups
+                if (key, row_group) not in self._shards
+                and (key, row_group) not in self._pending
+            ]
+            if not missing:
+                return
+            future = self._prefetch_executor().submit(
+                self._prefetch_row_groups, feature_file, key, bounds, missing, columns
+            )
+            for row_group in missing:
+                self._pending[(key, row_group)] = future
+
+    def _prefetch_row_groups(
+        self, feature_file: str, key, bounds: np.ndarray, row_groups: list, columns
+    ) -> dict:
+        try:
+            return self._read_row_groups(
+                feature_file, key, bounds, row_groups, columns, prefetched=True
+            )
+        finally:
+            with self._lock:
+                for row_group in row_groups:
+                    self._pending.pop((key, row_group), None)
+
+    def _prefetch_executor(self) -> ThreadPoolExecutor:
+        """The read-ahead thread pool of this process. Called with the lock held."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.PREFETCH_THREADS,
+                thread_name_prefix="shard-prefetch",
+            )
+        return self._executor
+
+    def _prefetch_one(self, feature_file: str, columns: list) -> FeatureShard:
+        key = self._key(feature_file, columns)
+        try:
+            return self._insert(key, self._read(feature_file, columns), prefetched=True)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _read(self, feature_file: str, columns: list = None) -> FeatureShard:
+        # ✅ Unselected columns are never decoded
+        table = pq.read_table(feature_file, columns=columns, memory_map=True)
+        return FeatureShard.from_table(
+            table, self.normaliser, FeatureSchema.ID_COLUMNS, source=feature_file
+        )
+
+    def _insert(
+        self, key, shard: FeatureShard, prefetched: bool = False
+    ) -> FeatureShard:
+        with self._lock:
+            if key in self._shards:
+                return self._shards[key]
+            self.prefetched += prefetched
+            self._shards[key] = shard
+            self.current_bytes += shard.nbytes
+            self._evict()
+        return shard
+
+    def _evict(self) -> None:
+        """Drops least recently used shards until the budget is met (the newest always stays).
+
+        Called with the lock held.
+        """
+        while self.current_bytes > self.max_bytes and len(self._shards) > 1:
+            _, shard = self._shards.popitem(last=False)
+            self.current_bytes -= shard.nbytes
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._shards.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+            "prefetch_waits": self.prefetch_waits,
+            "shards": len(self._shards),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"FeatureShardCache(hits={self.hits}, misses={self.misses}, "
+            f"evictions={self.evictions}, prefetched={self.prefetched}, "
+            f"prefetch_waits={self.prefetch_waits}, "
+            f"shards={len(self._shards)}, "
+            f"{self.current_bytes / 1024**2:.1f}/{self.max_bytes / 1024**2:.1f} MB)"
+        )
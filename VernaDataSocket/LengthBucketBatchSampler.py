@@ -0,0 +1,65 @@
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class LengthBucketBatchSampler(Sampler):
+    """Batches events of similar length so dynamic padding stays short.
+
+    Positions come from `sampler` (sequential, or a ShardLocalitySampler) in chunks of
+    `bucket_batches * batch_size`; each chunk is sorted by `lengths` (e.g. N_doms capped
+    at event_length, from the event index) and cut into batches; with `shuffle` the
+    batch order within the chunk changes every epoch, otherwise batches come shortest
+    first. Chunks follow the sampler, so shard locality and flavour balance are kept
+    at the scale of a chunk.
+    """
+
+    def __init__(
+        self,
+        sampler,
+        lengths: np.ndarray,
+        batch_size: int,
+        bucket_batches: int = 50,
+        drop_last: bool = False,
+        shuffle: bool = False,
+        seed: int = 42,
+    ) -> None:
+        self.sampler = sampler
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.chunk_size = max(1, bucket_batches) * batch_size
+        self.drop_last = drop_last
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+
+    def __len__(self) -> int:
+        n_full_chunks, remainder = divmod(len(self.sampler), self.chunk_size)
+        per_chunk = self.chunk_size // self.batch_size
+        if self.drop_last:
+            return n_full_chunks * per_chunk + remainder // self.batch_size
+        return n_full_chunks * per_chunk + -(-remainder // self.batch_size)
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+
+        positions = np.fromiter(iter(self.sampler), dtype=np.int64)
+        for start in range(0, len(positions), self.chunk_size):
+            chunk = positions[start : start + self.chunk_size]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind="stable")]
+            batches = [
+                chunk[i : i + self.batch_size]
+                for i in range(0, len(chunk), self.batch_size)
+            ]
+            if self.drop_last and len(batches[-1]) < self.batch_size:
+                batches.pop()
+            if not self.shuffle:
+                yield from (batch.tolist() for batch in batches)
+                continue
+            for batch_idx in rng.permutation(len(batches)):
+                yield batches[batch_idx].tolist()
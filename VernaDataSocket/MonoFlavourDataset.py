@@ -5,27 +5,25 @@ import pyarrow.parquet as pq
 import pyarrow.compute as pc
 import torch
 from torch.utils.data import Dataset
-from .PseudoNormaliser import PseudoNormaliser
+from .EventIndex import EventIndex
+from .FeatureShardCache import FeatureShardCache
+from .FeatureSchema import FeatureSchema
+from .Selection import Selection
 from Enum.EnergyRange import EnergyRange
 from Enum.Flavour import Flavour
 from Enum.ClassificationMode import ClassificationMode
 
 
 class MonoFlavourDataset(Dataset):
-    """Dataset for a single neutrino flavour spanning multiple truth files with two-file caching."""
+    """Dataset for a single neutrino flavour spanning multiple truth files.
+
+    Identification, pid and analysis truth are captured in the event index, so
+    `__getitem__` only reads the PMTfied feature shard.
+    """
 
     IDENTIFICATION = ["event_no", "offset", "shard_no", "N_doms"]
     TARGET = ["pid"]
-    ANALYSIS = [
-        "energy",
-        "zenith",
-        "azimuth",
-        "elasticity",
-        "dbang_decay_length",
-        "track_length",
-        "energy_GNHighestEDaughter",
-        "energy_GNHighestEInIceParticle",
-    ]
+    ANALYSIS = EventIndex.ANALYSIS
     REQUIRED_COLUMNS = IDENTIFICATION + TARGET + ANALYSIS
 
     def __init__(
@@ -35,15 +33,24 @@ class MonoFlavourDataset(Dataset):
         flavour: Flavour,
         N_events_monodataset: int,
         classification_mode: ClassificationMode = ClassificationMode.MULTIFLAVOUR,
-        selection: list = None,
+        selection=None,
+        index_cache_dir: str = None,
+        feature_cache_bytes: int = None,
+        prefetch_shards: int = 0,
+        whole_shard_reads: bool = True,
+        index_threads: int = None,
     ) -> None:
         self.root_dir = root_dir
         self.subdirectory_no = EnergyRange.get_subdir(er, flavour)
         self.N_events_monodataset = N_events_monodataset
         self.truth_file_dir = os.path.join(self.root_dir, f"{self.subdirectory_no}")
-        self.transform = PseudoNormaliser()
         self.classification_mode = classification_mode
-        self.selection = selection
+        self.selection = Selection.from_config(selection)
+        self.index_cache_dir = index_cache_dir
+        self.feature_cache_bytes = feature_cache_bytes
+        self.prefetch_shards = prefetch_shards  # shards read ahead in the background
+        self.whole_shard_reads = whole_shard_reads  # False: only the row groups needed
+        self.index_threads = index_threads  # truth files read at once
 
         self.truth_files = sorted(
             [
@@ -55,24 +62,14 @@ class MonoFlavourDataset(Dataset):
 
         self.event_index = self._build_event_index()
         self.selected_events = self._select_events()
-
-        self.truth_current = None
-        self.truth_next = None
-        self.current_truth_file = None
-        self.next_truth_file = None
+        self.targets = self._encode_targets(self.selected_events.pid)
+        # Columns read from the shards; None reads them all
+        self.read_columns = None
+        if self.selection.columns is not None and len(self.selected_events):
+            self.read_columns = self.feature_schema().shard_column_names
 
     def _build_event_index(self):
-        """Scans all truth files and builds an event index."""
-        event_index = []
-
-        def extract_part_number(filepath):
-            """Extracts part number from `truth_X.parquet` (only uses filename)."""
-            filename = os.path.basename(filepath)  # ✅ Extract just the filename
-            parts = filename.split("_")
-            if len(parts) < 2 or not parts[1].split(".")[0].isdigit():
-                return float("inf")  # Push invalid files to the end of sorting
-            return int(parts[1].split(".")[0])
-
+        """Scans all truth files and builds a columnar event index."""
         # ✅ Ensure sorting is based on extracted part numbers
         self.truth_files = sorted(
             [
@@ -80,141 +77,151 @@ class MonoFlavourDataset(Dataset):
                 for f in os.listdir(self.truth_file_dir)
                 if f.startswith("truth_") and f.endswith(".parquet")
             ],
-            key=extract_part_number,
+            key=EventIndex.part_number,
         )
 
         # ✅ Remove incorrectly sorted files (if they exist)
         self.truth_files = [
-            f
-            for f in self.truth_files
-            if extract_part_number(os.path.basename(f)) != float("inf")
+            f for f in self.truth_files if EventIndex.part_number(f) != float("inf")
         ]
-        for truth_file in self.truth_files:
-            truth_table = pq.read_table(
-                truth_file, columns=self.REQUIRED_COLUMNS, memory_map=True
-            )
+        return EventIndex.load_or_build(
+            cache_file=EventIndex.cache_file(
+                self.truth_file_dir,
+                self.index_cache_dir,
+                tag=f"mono{self.selection.tag}",
+            ),
+            truth_files=self.truth_files,
+            build=self._scan_truth_files,
+            n_events=self.N_events_monodataset,
+            key=self.REQUIRED_COLUMNS + self.selection.key(),
+        )
 
-            # ✅ Extract only the required columns
-            event_nos = np.array(truth_table.column("event_no"))
-            shard_nos = np.array(truth_table.column("shard_no"))
-            offsets = np.array(truth_table.column("offset"))
-            N_doms = np.array(truth_table.column("N_doms"))
-
-            for row_idx, event_no in enumerate(event_nos):
-                event_index.append(
-                    (
-                        event_no,
-                        truth_file,
-                        row_idx,
-                        shard_nos[row_idx],
-                        offsets[row_idx],
-                        N_doms[row_idx],
-                    )
-                )
-
-        # event_index.sort(key=lambda x: x[0])  # Sort for deterministic access
-        return event_index
+    def _scan_truth_files(self):
+        """Reads truth files in part order, stopping once N_events_monodataset is covered."""
+        if self.selection.truth_ranges:
+            candidate_files = self.truth_files
+        else:
+            # ✅ Footer row counts decide which files are needed before any is decoded
+            candidate_files = EventIndex.leading_files(
+                self.truth_files, self.N_events_monodataset
+            )
+        per_file_indices, n_selected = [], 0
+        for file_index in EventIndex.iter_truth_files(
+            candidate_files, self.REQUIRED_COLUMNS, self.selection, self.index_threads
+        ):
+            per_file_indices.append(file_index)
+            n_selected += len(file_index)
+            if n_selected >= self.N_events_monodataset:
+                break
+        scanned_files = candidate_files[: len(per_file_indices)]
+        return EventIndex.concatenate(per_file_indices, scanned_files)
 
     def _select_events(self):
         """Selects the first N_events_monodataset events from the event index."""
-        if not self.event_index:
-            return []
-        return self.event_index[: self.N_events_monodataset]
-
-    def _load_truth_file(self, truth_file):
-        """Loads a truth file and manages cache efficiently."""
-        if truth_file == self.current_truth_file:
-            return self.truth_current  # ✅ Return cached file
-
-        # ✅ If `truth_next` is ready, move it to `truth_current`
-        if self.truth_next is not None and truth_file == self.next_truth_file:
-            self.truth_current = self.truth_next
-            self.current_truth_file = self.next_truth_file
-        else:
-            # ✅ Directly load truth file if cache is empty
-            self.truth_current = pq.read_table(
-                truth_file, columns=self.REQUIRED_COLUMNS, memory_map=True
-            )
-            self.current_truth_file = truth_file
-
-        # ✅ Preload next truth file
-        try:
-            next_idx = self.truth_files.index(truth_file) + 1
-            if next_idx < len(self.truth_files):
-                self.next_truth_file = self.truth_files[next_idx]
-                self.truth_next = pq.read_table(
-                    self.next_truth_file, columns=self.REQUIRED_COLUMNS, memory_map=True
-                )
-            else:
-                self.next_truth_file = None
-                self.truth_next = None
-        except Exception:
-            self.next_truth_file = None
-            self.truth_next = None
+        return self.event_index.head(self.N_events_monodataset)
+
+    def feature_file(self, idx):
+        """Path of the PMTfied shard holding the DOMs of selected event `idx`."""
+        truth_file = self.selected_events.truth_files[self.selected_events.file_id[idx]]
+        # ✅ Correctly locate the feature file
+        part_no = int(os.path.basename(truth_file).split("_")[1].split(".")[0])
+        feature_dir = os.path.join(self.truth_file_dir, str(part_no))
+        shard_no = self.selected_events.shard_no[idx]
+        return os.path.join(feature_dir, f"PMTfied_{shard_no}.parquet")
 
-        return self.truth_current
+    def feature_schema(self) -> FeatureSchema:
+        """Column layout of the features as read, from the footer of the first shard."""
+        schema = FeatureSchema.from_file(self.feature_file(0))
+        if self.selection.columns is None:
+            return schema
+        return schema.select(self.selection.columns)
 
     def __len__(self):
         return len(self.selected_events)
 
     def __getitem__(self, idx):
         """Retrieve the event's features and target."""
-        event_no, truth_file, row_idx, shard_no, offset, N_doms = self.selected_events[
-            idx
-        ]
+        return self.__getitems__([idx])[0]
 
-        # ✅ Load truth file (only keeping two in memory)
-        truth_table = self._load_truth_file(truth_file)
-        row = truth_table.slice(row_idx, 1)
+    def __getitems__(self, indices):
+        """Retrieve many events at once; each event is a slice of its cached, normalised shard."""
+        indices = np.asarray(indices, dtype=np.int64)
+        events = self.selected_events
+        cache = FeatureShardCache.instance(self.feature_cache_bytes)
 
-        # ✅ Correctly locate the feature file
-        part_no = int(os.path.basename(truth_file).split("_")[1].split(".")[0])
-        feature_dir = os.path.join(self.truth_file_dir, str(part_no))
-        feature_file = os.path.join(feature_dir, f"PMTfied_{shard_no}.parquet")
+        features = [None] * len(indices)
+        for positions in events.group_by_shard(indices):
+            shard_indices = indices[positions]
+            feature_file = self.feature_file(shard_indices[0])
+            offsets = events.offset[shard_indices]
+            N_doms = events.N_doms[shard_indices]
+            if self.whole_shard_reads:
+                # ✅ normalised and NaN-scanned once
+                shard = cache.get(feature_file, self.read_columns)
+            else:
+                shard = cache.get_rows(feature_file, offsets, N_doms, self.read_columns)
+            valid = shard.valid_events(offsets, N_doms)
+            if not valid.all():
+                event_no = int(events.event_no[shard_indices[np.argmin(valid)]])
+                print(f"⚠️ NaN detected in event {event_no} from file {feature_file}")
+                raise ValueError(f"NaN detected in event {event_no}!")
 
-        # ✅ Load feature file if needed
-        if (
-            not hasattr(self, "current_feature_file")
-            or self.current_feature_file != feature_file
-        ):
-            self.current_feature_file = feature_file
-            self.current_features = pq.read_table(feature_file, memory_map=True)
+            for position, offset, n_doms in zip(positions, offsets, N_doms):
+                features[position] = torch.from_numpy(shard.event(offset, n_doms))
 
-        # ✅ Extract event features
-        features_table = self.current_features.slice(offset, N_doms).drop(
-            ["event_no", "original_event_no"]
+        # ✅ Targets and analysis truth come straight from the index
+        targets = self.targets[torch.from_numpy(indices)]
+        analysis_truth = events.analysis_truth(
+            indices, self.IDENTIFICATION + self.ANALYSIS
         )
-        features_np = np.column_stack(
-            [np.array(features_table[col]) for col in features_table.column_names]
+        return list(zip(features, targets, analysis_truth))
+
+    def prefetch(self, indices) -> None:
+        """Starts background reads for the events at `indices`, shard by shard in order:
+        of whole shards, or without `whole_shard_reads` of only the row groups needed.
+        """
+        if not self.prefetch_shards:
+            return
+        indices = np.asarray(indices, dtype=np.int64)
+        events = self.selected_events
+        cache = FeatureShardCache.instance(self.feature_cache_bytes)
+        shards = sorted(
+            events.group_by_shard(indices), key=lambda positions: positions[0]
         )
-        if np.isnan(features_np).any():
-            print(f"⚠️ NaN detected in event {event_no} from file {feature_file}")
-            raise ValueError(f"NaN detected in event {event_no}!")
-        features_np = self.transform(features_np, features_table.column_names)
-        if np.isnan(features_np).any():
-            print(f"⚠️ NaN introduced after normalisation! Event: {event_no}")
-            raise ValueError(f"NaN introduced in normalisation!")
-        features_tensor = torch.tensor(features_np, dtype=torch.float32)
-
-        # ✅ Encode target
+        if self.whole_shard_reads:
+            cache.prefetch(
+                [self.feature_file(indices[positions[0]]) for positions in shards],
+                self.read_columns,
+            )
+            return
+        for positions in shards:
+            shard_indices = indices[positions]
+            cache.prefetch_rows(
+                self.feature_file(shard_indices[0]),
+                events.offset[shard_indices],
+                events.N_doms[shard_indices],
+                self.read_columns,
+            )
+
+    def _encode_target(self, pid):
+        """Encode one particle ID according to the classification mode."""
         if self.classification_mode == ClassificationMode.MULTIFLAVOUR:
-            target = self._encode_target_multiflavour(row.column("pid")[0].as_py())
+            return self._encode_target_multiflavour(pid)
         elif self.classification_mode == ClassificationMode.TRACK_CASCADE_BINARY:
-            target = self._encode_target_track_cascade_binary(
-                row.column("pid")[0].as_py()
-            )
+            return self._encode_target_track_cascade_binary(pid)
         elif self.classification_mode == ClassificationMode.SIGNAL_NOISE_BINARY:
-            target = self._encode_target_signal_noise_binary(
-                row.column("pid")[0].as_py()
-            )
+            return self._encode_target_signal_noise_binary(pid)
         else:
             raise ValueError(f"Invalid classification mode: {self.classification_mode}")
 
-        analysis_truth = np.array(
-            [row.column(col)[0].as_py() for col in self.IDENTIFICATION + self.ANALYSIS]
-        )
-
-        return features_tensor, target, analysis_truth
+    def _encode_targets(self, pids):
+        """Encode all particle IDs at once; each distinct pid is encoded a single time."""
+        unique_pids, inverse = np.unique(pids, return_inverse=True)
+        encoded = [self._encode_target(int(pid)) for pid in unique_pids]
+        if not encoded:
+            n_classes = self.classification_mode.num_classes
+            return torch.empty((0, n_classes), dtype=torch.float32)
+        return torch.stack(encoded)[torch.from_numpy(inverse.reshape(-1))]
 
     def _encode_target_multiflavour(self, pid):
         """Encode particle ID as a one-hot vector."""
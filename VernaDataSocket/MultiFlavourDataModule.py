@@ -1,7 +1,16 @@
 import numpy as np
 import torch
 from .MultiFlavourDataset import MultiFlavourDataset
-from torch.utils.data import DataLoader
+from .ShardLocalitySampler import ShardLocalitySampler
+from .LengthBucketBatchSampler import LengthBucketBatchSampler
+from .TokenBudgetBatchSampler import TokenBudgetBatchSampler
+from .WorkerPartitionBatchSampler import WorkerPartitionBatchSampler
+from .ShardPrefetchBatchSampler import ShardPrefetchBatchSampler
+from .FeatureShardCache import FeatureShardCache
+from .SharedFeatureShardCache import SharedFeatureShardCache
+from .StreamingFlavourDataset import StreamingFlavourDataset
+from torch.utils.data import BatchSampler, DataLoader, SequentialSampler
+from torch.nn.utils.rnn import pad_sequence
 import pytorch_lightning as pl
 from Enum.Flavour import Flavour
 from Enum.EnergyRange import EnergyRange
@@ -28,6 +37,25 @@ class MultiFlavourDataModule(pl.LightningDataModule):
         root_dir_corsika=None,
         selection=None,
         order_by_this_column="Qtotal",
+        index_cache_dir=None,
+        feature_cache_bytes=None,
+        preprocessed_dir=None,
+        prefetch_shards=0,
+        whole_shard_reads=True,
+        index_threads=None,
+        shared_feature_cache=False,
+        streaming=False,
+        carry_analysis=False,
+        shuffle=False,
+        shuffle_window_shards=8,
+        bucket_by_length=False,
+        bucket_batches=50,
+        dynamic_padding=False,
+        max_tokens=None,
+        max_attention_cost=None,
+        packed=False,
+        partition_workers=False,
+        seed=42,
     ):
         super().__init__()
         self.root_dir = root_dir
@@ -45,11 +73,51 @@ class MultiFlavourDataModule(pl.LightningDataModule):
         self.root_dir_corsika = root_dir_corsika
         self.selection = selection
         self.order_by_this_column = order_by_this_column
+        self.index_cache_dir = index_cache_dir
+        self.feature_cache_bytes = feature_cache_bytes
+        self.preprocessed_dir = preprocessed_dir
+        self.prefetch_shards = prefetch_shards
+        self.whole_shard_reads = whole_shard_reads  # False: row-group reads
+        self.index_threads = index_threads  # truth files read at once
+        self.shared_feature_cache = shared_feature_cache  # one shard copy per node
+        self.streaming = streaming  # predict over whole directories, no index
+        self.carry_analysis = (
+            carry_analysis  # test/predict batches carry analysis truth
+        )
+        self.shuffle = shuffle
+        self.shuffle_window_shards = shuffle_window_shards
+        self.bucket_by_length = bucket_by_length
+        self.bucket_batches = bucket_batches
+        self.dynamic_padding = dynamic_padding  # pad to the longest event in the batch
+        self.max_tokens = max_tokens
+        self.max_attention_cost = max_attention_cost
+        self.packed = packed  # batches as (total_doms, d_input) plus per-event lengths
+        if bucket_by_length and not dynamic_padding:
+            # Padded to event_length, bucketed batches are as long as any other
+            raise ValueError("bucket_by_length needs dynamic_padding.")
+        token_budget = max_tokens is not None or max_attention_cost is not None
+        if token_budget and not (dynamic_padding or packed):
+            # Padded to event_length, a budget would only grow B and the batch tensor
+            raise ValueError(
+                "max_tokens and max_attention_cost need dynamic_padding or packed."
+            )
+        if partition_workers and (bucket_by_length or token_budget):
+            # Worker ranges are batched in shard order; they cannot also be regrouped
+            raise ValueError(
+                "partition_workers cannot be combined with bucket_by_length, "
+                "max_tokens or max_attention_cost."
+            )
+        self.partition_workers = partition_workers  # disjoint shards per worker
+        self.seed = seed
 
         self.dataset = None  # ✅ Store dataset globally and split later
+        self.stream_dataset = None
 
     def setup(self, stage=None):
         """Loads dataset once and splits it into train, validation, and test."""
+        if stage == "predict" and self.streaming:
+            self._setup_streaming()
+            return
         if self.dataset is None:
             self.dataset = MultiFlavourDataset(
                 root_dir=self.root_dir,
@@ -61,6 +129,12 @@ class MultiFlavourDataModule(pl.LightningDataModule):
                 classification_mode=self.classification_mode,
                 root_dir_corsika=self.root_dir_corsika,
                 selection=self.selection,
+                index_cache_dir=self.index_cache_dir,
+                feature_cache_bytes=self.feature_cache_bytes,
+                preprocessed_dir=self.preprocessed_dir,
+                prefetch_shards=self.prefetch_shards,
+                whole_shard_reads=self.whole_shard_reads,
+                index_threads=self.index_threads,
             )
 
             # ✅ Compute split sizes
@@ -80,90 +154,107 @@ class MultiFlavourDataModule(pl.LightningDataModule):
 
             self.remove_duplicate_noise_events()
 
-            # ✅ Get column index dynamically
-            first_event = self.train_dataset[0][0]
+            # ✅ Column layout from the Parquet footer; no events are read
+            self.feature_schema = self.dataset.datasets[0].feature_schema()
             self.index_order_by = self._get_order_by_index()
-            print(f"Feature Dimension: {first_event.shape[1]}")
+            print(f"Feature Dimension: {self.feature_schema.d_input}")
+
+            if self.shared_feature_cache and not FeatureShardCache.instance().SHARED:
+                # ✅ Installed before the workers fork, so they all find it
+                FeatureShardCache.install(
+                    SharedFeatureShardCache(
+                        self.feature_cache_bytes or FeatureShardCache.DEFAULT_MAX_BYTES
+                    )
+                )
+
+    def _setup_streaming(self):
+        """Streams every event of the selected directories instead of indexing them."""
+        if self.stream_dataset is not None:
+            return
+        self.stream_dataset = StreamingFlavourDataset.from_energy_range(
+            root_dir=self.root_dir,
+            er=self.er,
+            classification_mode=self.classification_mode,
+            root_dir_corsika=self.root_dir_corsika,
+            selection=self.selection,
+            feature_cache_bytes=self.feature_cache_bytes,
+            prefetch_shards=self.prefetch_shards,
+        )
+        self.carry_analysis = True  # ✅ a stream has no index to join the truth from
+        self.feature_schema = self.stream_dataset.feature_schema()
+        self.index_order_by = self._get_order_by_index()
+        print(f"Feature Dimension: {self.feature_schema.d_input}")
+        print(f"🌊 Streaming {len(self.stream_dataset.truth_files)} truth files")
 
     def remove_duplicate_noise_events(self):
         """Ensures no duplicate noise events across train/val/test splits."""
 
-        # Gather event_no for each subset
+        # ✅ event_no comes straight from the event index; no features are read
         def get_event_nos(subset):
-            event_nos = []
-            for i in range(len(subset)):
-                _, _, analysis = subset[i]
-                event_no = analysis[0]
-                event_nos.append(event_no)
-            return set(event_nos)
+            return self.dataset.index_column("event_no", subset.indices)
 
         train_event_nos = get_event_nos(self.train_dataset)
         val_event_nos = get_event_nos(self.val_dataset)
         test_event_nos = get_event_nos(self.test_dataset)
 
         # Remove overlaps from test dataset
-        overlap = (train_event_nos | val_event_nos) & test_event_nos
-        if overlap:
+        duplicated = np.isin(test_event_nos, np.union1d(train_event_nos, val_event_nos))
+        if duplicated.any():
+            overlap = np.unique(test_event_nos[duplicated])
             print(f"⚠️ Removing {len(overlap)} duplicate noise events from test set...")
 
             # Keep only unique test event_nos
-            unique_indices = [
-                i
-                for i in range(len(self.test_dataset))
-                if self.test_dataset[i][2][0] not in overlap
-            ]
+            unique_indices = np.asarray(self.test_dataset.indices)[~duplicated]
 
-            self.test_dataset = torch.utils.data.Subset(self.dataset, unique_indices)
+            self.test_dataset = torch.utils.data.Subset(
+                self.dataset, unique_indices.tolist()
+            )
             print("✅ Duplicate noise events removed from test set.")
 
     def _get_order_by_index(self):
-        """Finds the correct column index for ordering."""
-        try:
-            col_names = self.dataset.datasets[0].current_features.column_names
-            return col_names.index(self.order_by_this_column)
-        except ValueError:
-            raise KeyError(
-                f"Column '{self.order_by_this_column}' not found in feature set."
-            )
+        """Finds the column index for ordering within the feature tensors (ID columns dropped)."""
+        return self.feature_schema.index_of(self.order_by_this_column)
 
-    def pad_or_truncate(self, event: torch.Tensor):
-        """Pads or truncates events to `event_length` based on sorting by `order_by_this_column`."""
-        seq_length = event.size(0)
-        event = event[event[:, self.index_order_by].argsort(descending=True)]
-
-        # Truncate if too long
-        if seq_length > self.event_length:
-            event = event[: self.event_length]
-        else:
-            padding = torch.zeros((self.event_length - seq_length, event.size(1)))
-            event = torch.cat([event, padding], dim=0)
-
-        return event, seq_length
-
-    def pad_or_truncate_inference(self, event: torch.Tensor):
-        seq_length = event.size(0)
-        event = event[event[:, self.index_order_by].argsort(descending=True)]
-
-        if seq_length > self.inference_event_length:
-            # event = event[event[:, self.index_order_by].argsort(descending=True)][:self.inference_event_length]
-            event = event[: self.inference_event_length]
-        else:
-            padding = torch.zeros(
-                (self.inference_event_length - seq_length, event.size(1))
-            )
-            event = torch.cat([event, padding], dim=0)
+    def pad_or_truncate_batch(self, features: list, event_length: int):
+        """Pads or truncates a batch of events to `event_length` in one pass.
 
-        return event, seq_length
+        Each event's DOMs are ordered by `order_by_this_column` (descending) and the
+        leading `event_length` are kept; one batched `topk` orders all events at once.
+        With `dynamic_padding` the batch is padded only to its longest event. With
+        `packed` the kept DOMs are returned back to back as (total_doms, d_input),
+        together with the kept length of every event instead of its N_doms.
+        """
+        lengths = torch.tensor([event.size(0) for event in features], dtype=torch.int64)
+        if self.dynamic_padding:
+            event_length = min(int(lengths.max()), event_length)
+        flat = torch.cat(features)
+        keys = pad_sequence(
+            [event[:, self.index_order_by] for event in features],
+            batch_first=True,
+            padding_value=-float("inf"),
+        )
+        k = min(keys.size(1), event_length)
+        order = keys.topk(k, dim=1).indices  # padding sorts last
+        valid = torch.arange(k) < lengths[:, None]
+        starts = torch.cumsum(lengths, dim=0) - lengths
+        rows = (starts[:, None] + order)[valid]
+
+        if self.packed:
+            return flat[rows], valid.sum(dim=1)
+
+        batch_events = torch.zeros(
+            (len(features), event_length, flat.size(1)), dtype=flat.dtype
+        )
+        batch_events[:, :k][valid] = flat[rows]
+        return batch_events, lengths
 
     def train_validate_collate_fn(self, batch):
         features = [item[0] for item in batch]
         targets = [item[1] for item in batch]
-        batch_events, event_length = zip(
-            *[self.pad_or_truncate(event) for event in features]
+        batch_events, batch_event_length = self.pad_or_truncate_batch(
+            features, self.event_length
         )
-        batch_events = torch.stack(batch_events)
         batch_targets = torch.stack(targets)
-        batch_event_length = torch.tensor(event_length, dtype=torch.int64)
 
         return batch_events, batch_targets, batch_event_length
 
@@ -180,12 +271,14 @@ class MultiFlavourDataModule(pl.LightningDataModule):
     def long_predict_collate_fn(self, batch):
         features = [item[0] for item in batch]
         targets = [item[1] for item in batch]
-        batch_events, event_length = zip(
-            *[self.pad_or_truncate_inference(event) for event in features]
+        batch_events, batch_event_length = self.pad_or_truncate_batch(
+            features, self.inference_event_length
         )
-        batch_events = torch.stack(batch_events)
         batch_targets = torch.stack(targets)
-        batch_event_length = torch.tensor(event_length, dtype=torch.int64)
+        if self.carry_analysis:
+            # ✅ (B, len(ANALYSIS_COLUMNS)) float64, in the order of the batch
+            batch_analysis = torch.from_numpy(np.stack([item[2] for item in batch]))
+            return batch_events, batch_targets, batch_event_length, batch_analysis
         return batch_events, batch_targets, batch_event_length
 
     def _build_frac(self, frac_train, frac_val, frac_test):
@@ -195,11 +288,99 @@ class MultiFlavourDataModule(pl.LightningDataModule):
         self.frac_val = frac_val / total_frac
         self.frac_test = frac_test / total_frac
 
+    def _batching(self, subset, sampler=None, shuffle=False):
+        """DataLoader batching arguments: fixed-size batches, batches of disjoint shards
+        per worker, batches bucketed by N_doms, or batches packed to a token budget.
+
+        Partitioned workers shuffle with their own shard-locality samplers, so
+        `sampler` is not used then.
+        """
+        if self.partition_workers and self.num_workers > 1:
+            batch_sampler = WorkerPartitionBatchSampler(
+                subset,
+                batch_size=self.batch_size,
+                num_workers=self.num_workers,
+                shuffle=shuffle,
+                window_shards=self.shuffle_window_shards,
+                seed=self.seed,
+            )
+            return {
+                "batch_sampler": batch_sampler,
+                "worker_init_fn": WorkerPartitionBatchSampler.worker_init_fn,
+            }
+        token_budget = (
+            self.max_tokens is not None or self.max_attention_cost is not None
+        )
+        if not (self.bucket_by_length or token_budget):
+            return {"batch_size": self.batch_size, "shuffle": False, "sampler": sampler}
+        # ✅ Lengths come from the event index; no events are read
+        lengths = np.minimum(
+            self.dataset.index_column("N_doms", subset.indices), self.event_length
+        )
+        if sampler is None:
+            sampler = SequentialSampler(subset)
+        if token_budget:
+            batch_sampler = TokenBudgetBatchSampler(
+                sampler,
+                lengths,
+                max_tokens=self.max_tokens,
+                max_attention_cost=self.max_attention_cost,
+                chunk_size=self.bucket_batches * self.batch_size,
+                shuffle=shuffle,
+                seed=self.seed,
+            )
+            return {"batch_sampler": batch_sampler}
+        batch_sampler = LengthBucketBatchSampler(
+            sampler,
+            lengths,
+            batch_size=self.batch_size,
+            bucket_batches=self.bucket_batches,
+            shuffle=shuffle,
+            seed=self.seed,
+        )
+        return {"batch_sampler": batch_sampler}
+
+    def _planned(self, subset, batching: dict) -> tuple:
+        """DataLoader dataset and batching arguments, with prefetch plans if enabled.
+
+        With `prefetch_shards` the batches are wrapped in a ShardPrefetchBatchSampler
+        and the loader indexes the underlying dataset, so each batch reaches its
+        worker together with the shards that worker reads next.
+        """
+        if not self.prefetch_shards or self.preprocessed_dir:
+            return subset, batching
+        batching = dict(batching)
+        batch_sampler = batching.pop("batch_sampler", None)
+        if batch_sampler is None:
+            sampler = batching.pop("sampler", None)
+            batching.pop("batch_size", None)
+            batching.pop("shuffle", None)
+            batch_sampler = BatchSampler(
+                sampler if sampler is not None else SequentialSampler(subset),
+                self.batch_size,
+                drop_last=False,
+            )
+        batching["batch_sampler"] = ShardPrefetchBatchSampler(
+            batch_sampler, subset, self.prefetch_shards, self.num_workers
+        )
+        return subset.dataset, batching
+
     def train_dataloader(self):
-        return DataLoader(
+        # ✅ Shuffling goes through shard windows so reads stay sequential
+        sampler = None
+        if self.shuffle:
+            sampler = ShardLocalitySampler(
+                self.train_dataset,
+                window_shards=self.shuffle_window_shards,
+                seed=self.seed,
+            )
+        dataset, batching = self._planned(
             self.train_dataset,
-            batch_size=self.batch_size,
-            shuffle=False,
+            self._batching(self.train_dataset, sampler, shuffle=self.shuffle),
+        )
+        return DataLoader(
+            dataset,
+            **batching,
             num_workers=self.num_workers,
             collate_fn=self.train_validate_collate_fn,
             persistent_workers=True,
@@ -207,10 +388,12 @@ class MultiFlavourDataModule(pl.LightningDataModule):
         )
 
     def val_dataloader(self):
+        dataset, batching = self._planned(
+            self.val_dataset, self._batching(self.val_dataset)
+        )
         return DataLoader(
-            self.val_dataset,
-            batch_size=self.batch_size,
-            shuffle=False,
+            dataset,
+            **batching,
             num_workers=self.num_workers,
             collate_fn=self.train_validate_collate_fn,
             persistent_workers=True,
@@ -218,10 +401,28 @@ class MultiFlavourDataModule(pl.LightningDataModule):
         )
 
     def test_dataloader(self):
+        dataset, batching = self._planned(
+            self.test_dataset, {"batch_size": self.batch_size, "shuffle": False}
+        )
+        return DataLoader(
+            dataset,
+            **batching,
+            num_workers=self.num_workers,
+            collate_fn=self.long_predict_collate_fn,
+            persistent_workers=False,
+            pin_memory=False,
+        )
+
+    def predict_dataloader(self):
+        """Batches of the stream; each worker reads its own truth files.
+
+        Without `streaming` the test split is predicted instead.
+        """
+        if self.stream_dataset is None:
+            return self.test_dataloader()
         return DataLoader(
-            self.test_dataset,
+            self.stream_dataset,
             batch_size=self.batch_size,
-            shuffle=False,
             num_workers=self.num_workers,
             collate_fn=self.long_predict_collate_fn,
             persistent_workers=False,
@@ -1,15 +1,22 @@
 import os
 import numpy as np
+import pandas as pd
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from torch.utils.data import Dataset
 from .MonoFlavourDataset import MonoFlavourDataset
 from .NoiseDataset import NoiseDataset
+from .PreprocessedFlavourDataset import PreprocessedFlavourDataset
+from .EventIndex import EventIndex
+from .FeatureShardCache import FeatureShardCache
 from Enum.EnergyRange import EnergyRange
 from Enum.Flavour import Flavour
 from Enum.ClassificationMode import ClassificationMode
 
 
 class MultiFlavourDataset(Dataset):
+    ANALYSIS_COLUMNS = MonoFlavourDataset.IDENTIFICATION + MonoFlavourDataset.ANALYSIS
+
     def __init__(
         self,
         root_dir: str,
@@ -21,9 +28,21 @@ class MultiFlavourDataset(Dataset):
         classification_mode: ClassificationMode = ClassificationMode.MULTIFLAVOUR,
         root_dir_corsika: str = None,
         selection=None,
+        index_cache_dir: str = None,
+        feature_cache_bytes: int = None,
+        preprocessed_dir: str = None,
+        prefetch_shards: int = 0,
+        whole_shard_reads: bool = True,
+        index_threads: int = None,
     ) -> None:
         self.classification_mode = classification_mode
         self.selection = selection
+        self.index_cache_dir = index_cache_dir
+        self.feature_cache_bytes = feature_cache_bytes
+        self.preprocessed_dir = preprocessed_dir
+        self.prefetch_shards = prefetch_shards
+        self.whole_shard_reads = whole_shard_reads
+        self.index_threads = index_threads
         self.root_dir = root_dir
         self.root_dir_corsika = root_dir_corsika
 
@@ -36,7 +55,7 @@ class MultiFlavourDataset(Dataset):
         self._build_dataset()
 
         self.flavour_mapped_indices = self._create_index()
-        # [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1), ...]
+        # int64 array of shape (N, 2): [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1), ...]
         # where 0, 1, 2 are the dataset indices and 0, 1, ... are the local indices within each dataset
         # This will be used to access the datasets in a round-robin fashion
         # flavour_mapped_indices[0] = (0, 0) -> first event from the first dataset
@@ -63,24 +82,75 @@ class MultiFlavourDataset(Dataset):
                 f"Unsupported classification mode: {self.classification_mode}"
             )
 
+        if self.preprocessed_dir is not None:
+            self._build_preprocessed_dataset(selected_flavours, flavour_event_map)
+            return
+
+        # ✅ The flavour (and noise) indices are built concurrently, each over its
+        # own pool of truth file reads; results keep the flavour order
+        n_builds = len(selected_flavours) + 1
+        if self.index_threads == 1:
+            n_builds = 1
+        with ThreadPoolExecutor(max_workers=n_builds) as executor:
+            flavour_builds = [
+                executor.submit(
+                    MonoFlavourDataset,
+                    root_dir=self.root_dir,
+                    er=self.er,
+                    flavour=flavour,
+                    N_events_monodataset=flavour_event_map[flavour],
+                    classification_mode=self.classification_mode,
+                    selection=self.selection,
+                    index_cache_dir=self.index_cache_dir,
+                    feature_cache_bytes=self.feature_cache_bytes,
+                    prefetch_shards=self.prefetch_shards,
+                    whole_shard_reads=self.whole_shard_reads,
+                    index_threads=self.index_threads,
+                )
+                for flavour in selected_flavours
+            ]
+
+            # Add noise dataset only for SIGNAL_NOISE_BINARY
+            noise_build = None
+            if self.classification_mode == ClassificationMode.SIGNAL_NOISE_BINARY:
+                noise_build = executor.submit(
+                    NoiseDataset,
+                    root_dir=self.root_dir_corsika,
+                    N_events_noise=self.N_events_noise,
+                    selection=self.selection,
+                    index_cache_dir=self.index_cache_dir,
+                    feature_cache_bytes=self.feature_cache_bytes,
+                    prefetch_shards=self.prefetch_shards,
+                    whole_shard_reads=self.whole_shard_reads,
+                    index_threads=self.index_threads,
+                )
+
+            self.datasets = [build.result() for build in flavour_builds]
+            if noise_build is not None:
+                self.noise_dataset = noise_build.result()
+
+    def _build_preprocessed_dataset(self, selected_flavours, flavour_event_map):
+        """Serves the same selections from the stores written by `preprocess.py`.
+
+        A `selection` is applied when the stores are written, not here.
+        """
         self.datasets = [
-            MonoFlavourDataset(
-                root_dir=self.root_dir,
-                er=self.er,
-                flavour=flavour,
+            PreprocessedFlavourDataset(
+                store_dir=PreprocessedFlavourDataset.store_dir_for(
+                    self.preprocessed_dir, self.er, flavour
+                ),
                 N_events_monodataset=flavour_event_map[flavour],
                 classification_mode=self.classification_mode,
-                selection=self.selection,
             )
             for flavour in selected_flavours
         ]
-
-        # Add noise dataset only for SIGNAL_NOISE_BINARY
         if self.classification_mode == ClassificationMode.SIGNAL_NOISE_BINARY:
-            self.noise_dataset = NoiseDataset(
-                root_dir=self.root_dir_corsika,
-                N_events_noise=self.N_events_noise,
-                selection=self.selection,
+            self.noise_dataset = PreprocessedFlavourDataset(
+                store_dir=PreprocessedFlavourDataset.store_dir_for(
+                    self.preprocessed_dir, self.er
+                ),
+                N_events_monodataset=self.N_events_noise,
+                classification_mode=ClassificationMode.SIGNAL_NOISE_BINARY,
             )
 
     def _create_index(self):
@@ -92,14 +162,11 @@ class MultiFlavourDataset(Dataset):
 
     def _cyclic_interleave(self):
         """Standard round-robin interleaving."""
-        cyclic_indices = []
         dataset_lengths = [len(ds) for ds in self.datasets]
         common_length = min(dataset_lengths)
-        for i in range(common_length):
-            for ds_idx, ds_len in enumerate(dataset_lengths):
-                if i < ds_len:
-                    cyclic_indices.append((ds_idx, i))
-        return cyclic_indices
+        ds_ids = np.tile(np.arange(len(self.datasets)), common_length)
+        local_ids = np.repeat(np.arange(common_length), len(self.datasets))
+        return np.column_stack([ds_ids, local_ids])
 
     # def _interleave_signal_noise(self):
     #     """Interleaves e, noise, mu, noise, tau, noise..."""
@@ -133,24 +200,103 @@ class MultiFlavourDataset(Dataset):
         max_possible_steps = max_noise_events // len(signal_datasets)
         max_steps = min(min(signal_lengths), max_possible_steps)
 
-        interleaved = []
-        for i in range(max_steps):
-            for j, signal_ds in enumerate(signal_datasets):
-                interleaved.append((j, i))  # signal
-                noise_index = i * len(signal_datasets) + j
-                interleaved.append((len(signal_datasets), noise_index))  # noise
-        return interleaved
+        n_signal = len(signal_datasets)
+        steps = np.repeat(np.arange(max_steps), n_signal)
+        signal_ids = np.tile(np.arange(n_signal), max_steps)
+        signal = np.column_stack([signal_ids, steps])
+        noise_index = steps * n_signal + signal_ids
+        noise = np.column_stack([np.full_like(steps, n_signal), noise_index])
+        return np.stack([signal, noise], axis=1).reshape(-1, 2)
 
     def __len__(self):
         return len(self.flavour_mapped_indices)
 
+    def _dataset(self, ds_idx):
+        """Flavour dataset `ds_idx`, or the noise dataset for the index after them."""
+        if ds_idx < len(self.datasets):
+            return self.datasets[ds_idx]
+        return self.noise_dataset
+
+    def set_feature_cache_bytes(self, feature_cache_bytes: int) -> None:
+        """Changes the feature shard cache budget of this process, e.g. to a worker's share."""
+        self.feature_cache_bytes = feature_cache_bytes
+        n_datasets = len(self.datasets) + int(hasattr(self, "noise_dataset"))
+        for ds_idx in range(n_datasets):
+            self._dataset(ds_idx).feature_cache_bytes = feature_cache_bytes
+        FeatureShardCache.instance(feature_cache_bytes)
+
+    def index_column(self, name: str, indices=None) -> np.ndarray:
+        """Gathers EventIndex column `name` for the given global indices (all by default)."""
+        mapped = self.flavour_mapped_indices
+        if indices is not None:
+            mapped = mapped[np.asarray(indices, dtype=np.int64)]
+        ds_ids, local_ids = mapped[:, 0], mapped[:, 1]
+        values = np.empty(len(mapped), dtype=EventIndex.COLUMNS[name])
+        for ds_idx in np.unique(ds_ids):
+            mask = ds_ids == ds_idx
+            column = getattr(self._dataset(ds_idx).selected_events, name)
+            values[mask] = column[local_ids[mask]]
+        return values
+
+    def analysis_frame(self, indices=None) -> pd.DataFrame:
+        """Identification and analysis truth of the given global indices, straight from the index.
+
+        Columns and float64 values match the third element of each sample.
+        """
+        return pd.DataFrame(
+            {
+                name: self.index_column(name, indices).astype(np.float64)
+                for name in self.ANALYSIS_COLUMNS
+            }
+        )
+
+    def shard_groups(self, indices=None):
+        """Returns (dataset id, shard group id) per global index.
+
+        A shard group is one (flavour, truth part, shard_no) triple, i.e. one PMTfied file.
+        """
+        mapped = self.flavour_mapped_indices
+        if indices is not None:
+            mapped = mapped[np.asarray(indices, dtype=np.int64)]
+        ds_ids = mapped[:, 0]
+        keys = np.column_stack(
+            [
+                ds_ids,
+                self.index_column("file_id", indices),
+                self.index_column("shard_no", indices),
+            ]
+        )
+        _, groups = np.unique(keys, axis=0, return_inverse=True)
+        return ds_ids, groups.reshape(-1)
+
+    def __getitems__(self, indices):
+        """Batched retrieval: each underlying dataset serves its share in one call."""
+        mapped = self.flavour_mapped_indices[np.asarray(indices, dtype=np.int64)]
+        ds_ids, local_ids = mapped[:, 0], mapped[:, 1]
+        samples = [None] * len(mapped)
+        for ds_idx in np.unique(ds_ids):
+            positions = np.flatnonzero(ds_ids == ds_idx)
+            ds_samples = self._dataset(ds_idx).__getitems__(local_ids[positions])
+            for position, sample in zip(positions, ds_samples):
+                samples[position] = sample
+        # ✅ Planned batches name the shards this worker reads next
+        upcoming = getattr(indices, "upcoming", None)
+        if upcoming:
+            self.prefetch(upcoming)
+        return samples
+
+    def prefetch(self, indices) -> None:
+        """Starts background reads for the given global indices, in order."""
+        mapped = self.flavour_mapped_indices[np.asarray(indices, dtype=np.int64)]
+        # ✅ One call per dataset, datasets in order of their first event
+        ds_ids = mapped[:, 0]
+        _, first = np.unique(ds_ids, return_index=True)
+        for ds_idx in ds_ids[np.sort(first)].tolist():
+            self._dataset(ds_idx).prefetch(mapped[ds_ids == ds_idx, 1])
+
     def __getitem__(self, idx):
         ds_idx, local_idx = self.flavour_mapped_indices[idx]
-
-        if ds_idx < len(self.datasets):
-            sample = self.datasets[ds_idx][local_idx]
-        else:
-            sample = self.noise_dataset[local_idx]
+        sample = self._dataset(ds_idx)[local_idx]
 
         # event_no = int(sample[2][0])  # first column of analysis_truth
         # print(f"ds_idx: {ds_idx}, local_idx: {local_idx}, event_no: {event_no}")
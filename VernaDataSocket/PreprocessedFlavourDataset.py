@@ -0,0 +1,139 @@
+import os
+import json
+import numpy as np
+import torch
+from .MonoFlavourDataset import MonoFlavourDataset
+from .EventIndex import EventIndex
+from .FeatureSchema import FeatureSchema
+from Enum.EnergyRange import EnergyRange
+from Enum.Flavour import Flavour
+from Enum.ClassificationMode import ClassificationMode
+
+
+class PreprocessedFlavourDataset(MonoFlavourDataset):
+    """Serves events from a preprocessed CSR store instead of PMTfied Parquet shards.
+
+    A store holds one (EnergyRange, flavour) selection:
+        features.npy  normalised float32 DOM rows of every event, back to back
+        offsets.npy   CSR offsets (N + 1) of each event's rows in features.npy
+        index.npz     the EventIndex of the selection (identification, pid, analysis)
+        columns.json  feature/shard column names; written last, marks a complete store
+    Events are served as `torch.from_numpy` views of the memory-mapped rows.
+    """
+
+    FEATURES_FILE = "features.npy"
+    OFFSETS_FILE = "offsets.npy"
+    INDEX_FILE = "index.npz"
+    COLUMNS_FILE = "columns.json"
+
+    def __init__(
+        self,
+        store_dir: str,
+        N_events_monodataset: int,
+        classification_mode: ClassificationMode = ClassificationMode.MULTIFLAVOUR,
+    ) -> None:
+        self.store_dir = store_dir
+        self.N_events_monodataset = N_events_monodataset
+        self.classification_mode = classification_mode
+
+        with open(os.path.join(self.store_dir, self.COLUMNS_FILE), "r") as f:
+            columns = json.load(f)
+        self.feature_columns = columns["feature_columns"]
+        self.shard_columns = columns["shard_columns"]
+        self.truth_file_dir = columns["truth_file_dir"]
+
+        self.event_index = EventIndex.read(
+            os.path.join(self.store_dir, self.INDEX_FILE)
+        )
+        self.selected_events = self._select_events()
+        self.targets = self._encode_targets(self.selected_events.pid)
+        self.offsets = np.load(os.path.join(self.store_dir, self.OFFSETS_FILE))
+        self._features = None  # ✅ Memory-mapped lazily, once per process
+
+    @staticmethod
+    def store_dir_for(
+        preprocessed_dir: str, er: EnergyRange, flavour: Flavour = None
+    ) -> str:
+        """Store location of a flavour selection, or of the CORSIKA noise when `flavour` is None."""
+        if flavour is None:
+            return os.path.join(preprocessed_dir, "corsika")
+        return os.path.join(preprocessed_dir, er.string, flavour.alias)
+
+    @property
+    def features(self) -> np.ndarray:
+        if self._features is None:
+            # Copy-on-write mapping: writable views for torch, the file is never modified
+            self._features = np.load(
+                os.path.join(self.store_dir, self.FEATURES_FILE), mmap_mode="c"
+            )
+        return self._features
+
+    def __getstate__(self):
+        # ✅ Workers map the file themselves instead of receiving a pickled copy
+        state = self.__dict__.copy()
+        state["_features"] = None
+        return state
+
+    def feature_schema(self) -> FeatureSchema:
+        return FeatureSchema(self.shard_columns)
+
+    def prefetch(self, indices) -> None:
+        pass  # the store is memory-mapped; there are no shards to read ahead
+
+    def __getitems__(self, indices):
+        """Retrieve many events as zero-copy views of the memory-mapped store."""
+        indices = np.asarray(indices, dtype=np.int64)
+        features = [
+            torch.from_numpy(
+                np.asarray(self.features[self.offsets[idx] : self.offsets[idx + 1]])
+            )
+            for idx in indices
+        ]
+        targets = self.targets[torch.from_numpy(indices)]
+        analysis_truth = self.selected_events.analysis_truth(
+            indices, self.IDENTIFICATION + self.ANALYSIS
+        )
+        return list(zip(features, targets, analysis_truth))
+
+    @classmethod
+    def write(cls, dataset, store_dir: str, chunk_size: int = 4096) -> None:
+        """Converts the selection of a MonoFlavourDataset or NoiseDataset into a store."""
+        events = dataset.selected_events
+        if len(events) == 0:
+            raise ValueError(f"Nothing to preprocess into {store_dir}: no events.")
+        os.makedirs(store_dir, exist_ok=True)
+
+        offsets = np.zeros(len(events) + 1, dtype=np.int64)
+        np.cumsum(events.N_doms, out=offsets[1:])
+        schema = dataset.feature_schema()
+
+        features = np.lib.format.open_memmap(
+            os.path.join(store_dir, cls.FEATURES_FILE),
+            mode="w+",
+            dtype=np.float32,
+            shape=(int(offsets[-1]), schema.d_input),
+        )
+        # ✅ Consecutive chunks follow the index order, so shards are read sequentially
+        for start in range(0, len(events), chunk_size):
+            stop = min(start + chunk_size, len(events))
+            chunk = dataset.__getitems__(np.arange(start, stop))
+            features[offsets[start] : offsets[stop]] = torch.cat(
+                [event_features for event_features, _, _ in chunk]
+            ).numpy()
+            print(f"🧊 {stop}/{len(events)} events written to {store_dir}")
+        features.flush()
+        del features
+
+        np.save(os.path.join(store_dir, cls.OFFSETS_FILE), offsets)
+        events.write(os.path.join(store_dir, cls.INDEX_FILE))
+        with open(os.path.join(store_dir, cls.COLUMNS_FILE), "w") as f:
+            json.dump(
+                {
+                    "feature_columns": schema.column_names,
+                    "shard_columns": schema.shard_column_names,
+                    "truth_file_dir": dataset.truth_file_dir,
+                    "N_events": len(events),
+                },
+                f,
+                indent=4,
+            )
@@ -3,26 +3,79 @@ import pyarrow as pa
 
 
 class PseudoNormaliser:
-    def __init__(self):
+    Q_COLUMNS = ["q1", "q2", "q3", "q4", "q5", "Q25", "Q75", "Qtotal", "Q_halftime"]
+    POS_COLUMNS = [
+        "dom_x",
+        "dom_y",
+        "dom_z",
+        "dom_x_rel",
+        "dom_y_rel",
+        "dom_z_rel",
+        "hypotenuse",
+    ]
+    T_COLUMNS_SHIFT = ["t1", "t2", "t3", "t4", "t5", "t_qmax", "t_qmax_secondhalf"]
+    T_COLUMNS_SCALE = T_COLUMNS_SHIFT + ["T10", "T50", "T70", "T90", "sigmaT"]
+
+    def __init__(self, compiled: bool = True):
         self.position_scaler = 2e-3
         self.t_scaler = 3e-4  # 1/(3e-4) = 3333.33
         self.t_shifter = 1e4
         self.Q_shifter = 2
+        self.compiled = compiled
+        self._plans = {}  # column layout -> (q indices, shift vector, scale vector)
 
     def __call__(self, features_np: np.ndarray, column_names: list[str]) -> np.ndarray:
         """
         Apply the normalisation steps directly to a NumPy array.
+        Works on one event or on a concatenated block of DOM rows alike.
         """
+        if self.compiled:
+            return self._apply_compiled(features_np, column_names)
         features_np = self._log10_charge(features_np, column_names)
         features_np = self._pseudo_normalise_dom_pos(features_np, column_names)
         features_np = self._pseudo_normalise_time(features_np, column_names)
         return features_np
 
+    def compile(self, column_names: list[str]) -> tuple:
+        """Resolves the column lists once per layout into index and broadcast arrays."""
+        key = tuple(column_names)
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        def indices(columns):
+            return np.array(
+                [column_names.index(col) for col in columns if col in column_names],
+                dtype=np.int64,
+            )
+
+        # Positions and times are disjoint from the charges, so one affine covers both
+        shift = np.zeros(len(column_names), dtype=np.float64)
+        scale = np.ones(len(column_names), dtype=np.float64)
+        scale[indices(self.POS_COLUMNS)] = self.position_scaler
+        shift[indices(self.T_COLUMNS_SHIFT)] = self.t_shifter
+        scale[indices(self.T_COLUMNS_SCALE)] = self.t_scaler
+        plan = (indices(self.Q_COLUMNS), shift, scale)
+        self._plans[key] = plan
+        return plan
+
+    def _apply_compiled(
+        self, features_np: np.ndarray, column_names: list[str]
+    ) -> np.ndarray:
+        q_idx, shift, scale = self.compile(column_names)
+        features_np[:, q_idx] = (
+            np.log10(np.clip(features_np[:, q_idx], a_min=1e-9, a_max=None))
+            - self.Q_shifter
+        )
+        # Shift then scale, as in the per-column path
+        features_np -= shift.astype(features_np.dtype, copy=False)
+        features_np *= scale.astype(features_np.dtype, copy=False)
+        return features_np
+
     def _log10_charge(
         self, features_np: np.ndarray, column_names: list[str]
     ) -> np.ndarray:
-        q_columns = ["q1", "q2", "q3", "q4", "q5", "Q25", "Q75", "Qtotal", "Q_halftime"]
-        for col_name in q_columns:
+        for col_name in self.Q_COLUMNS:
             if col_name in column_names:
                 idx = column_names.index(col_name)
                 features_np[:, idx] = (
@@ -34,16 +87,7 @@ class PseudoNormaliser:
     def _pseudo_normalise_dom_pos(
         self, features_np: np.ndarray, column_names: list[str]
     ) -> np.ndarray:
-        pos_columns = [
-            "dom_x",
-            "dom_y",
-            "dom_z",
-            "dom_x_rel",
-            "dom_y_rel",
-            "dom_z_rel",
-            "hypotenuse",
-        ]
-        for col_name in pos_columns:
+        for col_name in self.POS_COLUMNS:
             if col_name in column_names:
                 idx = column_names.index(col_name)
                 features_np[:, idx] *= self.position_scaler
@@ -52,30 +96,14 @@ class PseudoNormaliser:
     def _pseudo_normalise_time(
         self, features_np: np.ndarray, column_names: list[str]
     ) -> np.ndarray:
-        t_columns_shift = ["t1", "t2", "t3", "t4", "t5", "t_qmax", "t_qmax_secondhalf"]
-        t_columns_scale = [
-            "t1",
-            "t2",
-            "t3",
-            "t4",
-            "t5",
-            "t_qmax",
-            "t_qmax_secondhalf",
-            "T10",
-            "T50",
-            "T70",
-            "T90",
-            "sigmaT",
-        ]
-
         # Time shift first
-        for col_name in t_columns_shift:
+        for col_name in self.T_COLUMNS_SHIFT:
             if col_name in column_names:
                 idx = column_names.index(col_name)
                 features_np[:, idx] -= self.t_shifter
 
         # Then scale
-        for col_name in t_columns_scale:
+        for col_name in self.T_COLUMNS_SCALE:
             if col_name in column_names:
                 idx = column_names.index(col_name)
                 features_np[:, idx] *= self.t_scaler
@@ -0,0 +1,38 @@
+import numpy as np
+from .FeatureShard import FeatureShard
+
+
+class RowGroupShard:
+    """The row groups of one PMTfied shard that a set of events needs, as one shard.
+
+    `blocks` are FeatureShards of consecutive-or-not row groups in file order, and
+    together cover every event asked for. Offsets are file rows, as for a whole
+    FeatureShard; an event spanning two row groups is copied into one array.
+    """
+
+    def __init__(self, blocks: list) -> None:
+        self.blocks = blocks
+        self.row_starts = np.array([block.row_start for block in blocks])
+        self.invalid_rows = np.concatenate(
+            [block.invalid_rows for block in blocks]
+        ).astype(np.int64)
+        self.column_names = blocks[0].column_names
+
+    # ✅ invalid_rows are file rows here too, so the NaN rule is FeatureShard's
+    valid_events = FeatureShard.valid_events
+
+    def event(self, offset: int, N_doms: int) -> np.ndarray:
+        """DOM rows of one event; a view unless the event spans row groups."""
+        block_idx = np.searchsorted(self.row_starts, offset, side="right") - 1
+        stop = offset + N_doms
+        if stop <= self.blocks[block_idx].row_stop:
+            return self.blocks[block_idx].event(offset, N_doms)
+
+        pieces, row = [], offset
+        while row < stop:
+            block = self.blocks[block_idx]
+            piece_stop = min(stop, block.row_stop)
+            pieces.append(block.event(row, piece_stop - row))
+            row = piece_stop
+            block_idx += 1
+        return np.concatenate(pieces)
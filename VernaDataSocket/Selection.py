@@ -0,0 +1,68 @@
+import json
+import hashlib
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class Selection:
+    """Which feature columns to load and which events to keep.
+
+    `columns` are the feature columns (ID columns excluded) in the order of the
+    feature tensors; None keeps every column. `truth_ranges` maps truth columns to
+    inclusive `(low, high)` bounds, either of which may be None; the ranges are
+    evaluated with `pyarrow.compute` while the event index is built, so events
+    outside them are never indexed.
+
+    From a config, `selection` is a list of columns or a dict with the keys
+    `columns` and `truth_ranges`.
+    """
+
+    def __init__(self, columns: list = None, truth_ranges: dict = None) -> None:
+        self.columns = list(columns) if columns is not None else None
+        self.truth_ranges = {
+            column: tuple(bounds) for column, bounds in (truth_ranges or {}).items()
+        }
+
+    @classmethod
+    def from_config(cls, selection) -> "Selection":
+        if selection is None:
+            return cls()
+        if isinstance(selection, Selection):
+            return selection
+        if isinstance(selection, dict):
+            return cls(selection.get("columns"), selection.get("truth_ranges"))
+        return cls(columns=selection)
+
+    @property
+    def truth_columns(self) -> list:
+        """Truth columns the predicates read."""
+        return list(self.truth_ranges)
+
+    def key(self) -> list:
+        """Part of the event index cache key; column choices do not change the index."""
+        return [
+            f"{column}:{json.dumps(list(bounds))}"
+            for column, bounds in sorted(self.truth_ranges.items())
+        ]
+
+    @property
+    def tag(self) -> str:
+        """Suffix keeping the index caches of different predicates apart."""
+        if not self.truth_ranges:
+            return ""
+        return "_" + hashlib.sha1(json.dumps(self.key()).encode()).hexdigest()[:8]
+
+    def mask(self, truth_table: pa.Table) -> np.ndarray:
+        """Boolean mask of the rows of `truth_table` inside every truth range."""
+        mask = pa.array(np.ones(truth_table.num_rows, dtype=bool))
+        for column, (low, high) in self.truth_ranges.items():
+            values = truth_table.column(column)
+            if low is not None:
+                mask = pc.and_(mask, pc.greater_equal(values, low))
+            if high is not None:
+                mask = pc.and_(mask, pc.less_equal(values, high))
+        return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+    def __repr__(self) -> str:
+        return f"Selection(columns={self.columns}, truth_ranges={self.truth_ranges})"
@@ -0,0 +1,63 @@
+import numpy as np
+from torch.utils.data import Sampler, Subset
+
+
+class ShardLocalitySampler(Sampler):
+    """Shuffles a MultiFlavourDataset (or a Subset of it) without giving up sequential shard reads.
+
+    Per flavour, the shard order is shuffled and events are shuffled only inside
+    windows of `window_shards` consecutive shards, so at most that many PMTfied files
+    per flavour are in use at a time. The flavour streams are then merged by their
+    relative progress, which keeps the balance of the round-robin interleave
+    (e, mu, tau, e, mu, tau, ... or the signal/noise alternation).
+    """
+
+    def __init__(self, data_source, window_shards: int = 8, seed: int = 42) -> None:
+        if isinstance(data_source, Subset):
+            dataset, indices = data_source.dataset, np.asarray(data_source.indices)
+        else:
+            dataset, indices = data_source, np.arange(len(data_source))
+        self.window_shards = max(1, window_shards)
+        self.seed = seed
+        self.epoch = 0
+        # Positions are relative to `data_source`, which is what the DataLoader indexes
+        self.flavours, self.groups = dataset.shard_groups(indices)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+
+        streams = [
+            self._shuffle_stream(np.flatnonzero(self.flavours == flavour), rng)
+            for flavour in np.unique(self.flavours)
+        ]
+        return iter(self.merge_by_progress(streams).tolist())
+
+    @staticmethod
+    def merge_by_progress(streams: list) -> np.ndarray:
+        """Merges per-flavour position streams by relative progress (ties in stream order)."""
+        streams = [stream for stream in streams if len(stream)]
+        if not streams:
+            return np.empty(0, dtype=np.int64)
+        progress = np.concatenate([np.arange(len(st)) / len(st) for st in streams])
+        stream_ids = np.concatenate(
+            [np.full(len(st), i) for i, st in enumerate(streams)]
+        )
+        order = np.lexsort((stream_ids, progress))
+        return np.concatenate(streams)[order]
+
+    def _shuffle_stream(self, positions: np.ndarray, rng) -> np.ndarray:
+        """Shuffles shard order, then events within windows of `window_shards` shards."""
+        groups = self.groups[positions]
+        unique_groups = np.unique(groups)
+        shard_rank = np.empty(unique_groups.max() + 1, dtype=np.int64)
+        shard_rank[rng.permutation(unique_groups)] = np.arange(len(unique_groups))
+        window = shard_rank[groups] // self.window_shards
+        order = np.lexsort((rng.random(len(positions)), window))
+        return positions[order]
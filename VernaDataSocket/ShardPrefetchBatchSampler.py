@@ -0,0 +1,85 @@
+import numpy as np
+from torch.utils.data import Sampler, Subset
+
+
+class PlannedBatch(list):
+    """A batch of dataset indices that also carries `upcoming`: the dataset indices of
+    the events in the shards its worker reads next, in the order the sampler will ask
+    for them."""
+
+    def __init__(self, indices: list, upcoming: list) -> None:
+        super().__init__(indices)
+        self.upcoming = upcoming
+
+
+class ShardPrefetchBatchSampler(Sampler):
+    """Tags the batches of another batch sampler with the shards read after them.
+
+    Each epoch the batches of `batch_sampler` (positions into `data_source`, a
+    MultiFlavourDataset or a Subset of it) are planned up front. A map-style
+    DataLoader hands batch i to worker i % num_workers, so the shards that worker
+    reads next are those of batches i + num_workers, i + 2 * num_workers, ...; the
+    events of the first `n_shards` of them not in batch i travel with it as a
+    PlannedBatch of dataset indices, so a dataset reading only row groups can read
+    ahead just the row groups those events need. The DataLoader must index the
+    underlying dataset directly, since a Subset would rebuild the batch and drop
+    the plan.
+
+    The plan follows whatever order the sampler chose (shuffled shard windows,
+    length buckets, token budgets, worker partitions) and ends with the subset.
+    """
+
+    def __init__(
+        self, batch_sampler, data_source, n_shards: int, num_workers: int = 0
+    ) -> None:
+        if isinstance(data_source, Subset):
+            self.dataset = data_source.dataset
+            self.indices = np.asarray(data_source.indices)
+        else:
+            self.dataset = data_source
+            self.indices = np.arange(len(data_source))
+        self.batch_sampler = batch_sampler
+        self.n_shards = n_shards
+        self.stride = max(1, num_workers)
+        _, self.groups = self.dataset.shard_groups(self.indices)
+
+    def set_epoch(self, epoch: int) -> None:
+        if hasattr(self.batch_sampler, "set_epoch"):
+            self.batch_sampler.set_epoch(epoch)
+
+    def __len__(self) -> int:
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        batches = [np.asarray(batch, dtype=np.int64) for batch in self.batch_sampler]
+        batch_shards = [self._shards(batch) for batch in batches]
+        for i, batch in enumerate(batches):
+            yield PlannedBatch(
+                self.indices[batch].tolist(), self._upcoming(batch_shards, i)
+            )
+
+    def _shards(self, batch: np.ndarray) -> list:
+        """(shard group, dataset indices) of each shard of `batch`, in batch order."""
+        groups = self.groups[batch]
+        _, first = np.unique(groups, return_index=True)
+        return [
+            (group, self.indices[batch[groups == group]].tolist())
+            for group in groups[np.sort(first)].tolist()
+        ]
+
+    def _upcoming(self, batch_shards: list, i: int) -> list:
+        """Dataset indices of the events of the next `n_shards` shards of batch i's worker,
+        in the batches up to the one where the last of those shards first appears."""
+        current = {group for group, _ in batch_shards[i]}
+        chosen, upcoming = set(), []
+        for shards in batch_shards[i + self.stride :: self.stride]:
+            for group, indices in shards:
+                if group in current:
+                    continue
+                if group not in chosen and len(chosen) < self.n_shards:
+                    chosen.add(group)
+                if group in chosen:
+                    upcoming += indices
+            if len(chosen) == self.n_shards:
+                return upcoming
+        return upcoming
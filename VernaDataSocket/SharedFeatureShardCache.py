@@ -0,0 +1,359 @@
+import os
+import time
+import uuid
+import signal
+import threading
+import atexit
+import multiprocessing
+import multiprocessing.util
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from .FeatureShard import FeatureShard
+from .FeatureShardCache import FeatureShardCache
+from .RowGroupShard import RowGroupShard
+
+
+class SharedFeatureShardCache(FeatureShardCache):
+    """FeatureShardCache whose shards live in POSIX shared memory, one copy per node.
+
+    Created and installed in the main process before the DataLoader workers fork.
+    A `multiprocessing.Manager` holds the registry {shard key: segment entry} and its
+    lock; a shard is decoded and normalised by the first process that asks for it
+    and then mapped by every other one. Each process keeps at most `max_attached`
+    shards mapped and is recorded as their holder in the registry ({pid: count});
+    `max_bytes` is the budget of all segments together, and only shards no live
+    process holds are unlinked. A worker gives its holds back when it exits, and the
+    holds of a process that died without doing so are dropped at the next eviction.
+
+    Segments are untracked by the per-process resource tracker (which would unlink
+    them when a worker exits) and unlinked by the main process on `close` or at exit,
+    including those still being loaded; a load that finishes after `close` unlinks
+    its own segment. A shard whose loading process died is loaded again by the next
+    process that asks for it. Row-group reads are served from whole shared shards.
+    """
+
+    SHARED = True
+    DEFAULT_MAX_ATTACHED = 16
+    POLL_SECONDS = 0.005
+    LOADING_TIMEOUT_SECONDS = 600
+
+    def __init__(
+        self,
+        max_bytes: int = FeatureShardCache.DEFAULT_MAX_BYTES,
+        max_attached: int = DEFAULT_MAX_ATTACHED,
+    ) -> None:
+        self.max_attached = max_attached
+        self._owner_pid = os.getpid()
+        super().__init__(max_bytes)
+        self._manager = multiprocessing.Manager()
+        self._registry = self._manager.dict()
+        self._registry_lock = self._manager.Lock()
+        self._closed = self._manager.Value("b", False)
+        atexit.register(self.close)
+
+    def _reset_threads(self) -> None:
+        super()._reset_threads()
+        # A forked worker holds no references yet, whatever its parent had mapped
+        self._shards = OrderedDict()
+        self._segments = {}  # shard key -> SharedMemory mapped by this process
+        self._unclosed = []  # released mappings that still had views on them
+        if os.getpid() != self._owner_pid:
+            # ✅ Workers leave through os._exit, which runs these finalizers, not atexit
+            multiprocessing.util.Finalize(self, self._release_at_exit, exitpriority=10)
+
+    def get(self, feature_file: str, columns: list = None) -> FeatureShard:
+        """Returns the shard of `feature_file`, mapping it from shared memory."""
+        if self._pid != os.getpid():
+            self._reset_threads()
+        key = self._key(feature_file, columns)
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                self.hits += 1
+                return shard
+
+        shm, entry = self._acquire(key, feature_file, columns)
+        shard = self._view(shm, entry)
+        with self._lock:
+            if key in self._shards:
+                # Another thread of this process mapped it meanwhile
+                self._release(key, shm)
+                return self._shards[key]
+            self._shards[key] = shard
+            self._segments[key] = shm
+            self._evict()
+        return shard
+
+    def get_rows(
+        self,
+        feature_file: str,
+        offsets: np.ndarray,
+        N_doms: np.ndarray,
+        columns: list = None,
+    ) -> RowGroupShard:
+        return RowGroupShard([self.get(feature_file, columns)])
+
+    def prefetch_rows(
+        self,
+        feature_file: str,
+        offsets: np.ndarray,
+        N_doms: np.ndarray,
+        columns: list = None,
+    ) -> None:
+        # Row groups are served from whole shared shards, so those are read ahead
+        self.prefetch([feature_file], columns)
+
+    def _prefetch_one(self, feature_file: str, columns: list) -> FeatureShard:
+        try:
+            shard = self.get(feature_file, columns)
+            self.prefetched += 1
+            return shard
+        finally:
+            with self._lock:
+                self._pending.pop(self._key(feature_file, columns), None)
+
+    def _acquire(self, key, feature_file: str, columns: list) -> tuple:
+        """Maps the segment of `key`, decoding the shard first if no process has."""
+        name = f"vds_{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        waited_since = time.time()
+        while True:
+            with self._registry_lock:
+                entry = self._registry.get(key)
+                if entry is not None and entry["state"] == "ready":
+                    pid = os.getpid()
+                    entry["holders"][pid] = entry["holders"].get(pid, 0) + 1
+                    entry["last_used"] = time.time()
+                    self._registry[key] = entry
+                    self.hits += 1
+                    return self._open(entry["name"]), entry
+                if entry is not None and not self._alive(entry["pid"]):
+                    # ✅ Its loader died (e.g. OOM-killed); load it here instead
+                    self._unlink(entry["name"])
+                    entry = None
+                if entry is None:
+                    self._registry[key] = {
+                        "state": "loading",
+                        "name": name,
+                        "pid": os.getpid(),
+                    }
+                    break
+            if time.time() - waited_since > self.LOADING_TIMEOUT_SECONDS:
+                raise TimeoutError(
+                    f"Shard {feature_file} still loading in process {entry['pid']}"
+                )
+            time.sleep(self.POLL_SECONDS)  # ✅ another process is decoding it
+
+        self.misses += 1
+        shm = None
+        try:
+            shard = self._read(feature_file, columns)
+            shm = self._open(
+                name, size=max(1, shard.nbytes + shard.invalid_rows.nbytes), create=True
+            )
+            entry = {
+                "state": "ready",
+                "name": shm.name,
+                "shape": shard.features.shape,
+                "n_invalid": len(shard.invalid_rows),
+                "column_names": shard.column_names,
+                "nbytes": shard.nbytes,
+                "holders": {os.getpid(): 1},
+                "last_used": time.time(),
+            }
+            features, invalid_rows = self._arrays(shm, entry)
+            features[...] = shard.features
+            invalid_rows[...] = shard.invalid_rows
+            with self._registry_lock:
+                if self._closed.value:
+                    raise RuntimeError("SharedFeatureShardCache is closed")
+                self._registry[key] = entry
+                self._evict_shared()
+        except BaseException:
+            # Nothing may outlive a failed load, not even after `close`
+            if shm is not None:
+                shm.close()
+            self._unlink(name)
+            try:
+                with self._registry_lock:
+                    if self._registry.get(key, {}).get("name") == name:
+                        del self._registry[key]
+            except (OSError, EOFError):
+                pass  # the manager already stopped
+            raise
+        return shm, entry
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        """Whether process `pid` still runs; an exited, unreaped (zombie) process does not."""
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except OSError:
+            return True
+
+    @staticmethod
+    def _arrays(shm: SharedMemory, entry: dict) -> tuple:
+        features = np.ndarray(entry["shape"], dtype=np.float32, buffer=shm.buf)
+        invalid_rows = np.ndarray(
+            (entry["n_invalid"],),
+            dtype=np.int64,
+            buffer=shm.buf,
+            offset=features.nbytes,
+        )
+        return features, invalid_rows
+
+    def _view(self, shm: SharedMemory, entry: dict) -> FeatureShard:
+        features, invalid_rows = self._arrays(shm, entry)
+        return FeatureShard(features, entry["column_names"], invalid_rows)
+
+    @staticmethod
+    def _open(name: str, size: int = 0, create: bool = False) -> SharedMemory:
+        """Creates or maps a segment without the resource tracker's claim on it."""
+        try:
+            return SharedMemory(name=name, create=create, size=size, track=False)
+        except TypeError:  # Python < 3.13 always tracks
+            shm = SharedMemory(name=name, create=create, size=size)
+            resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+    def _evict(self) -> None:
+        """Unmaps least recently used shards beyond `max_attached` (the newest always stays).
+
+        Called with the lock held.
+        """
+        while len(self._shards) > max(1, self.max_attached):
+            key, _ = self._shards.popitem(last=False)
+            self._release(key, self._segments.pop(key))
+            self.evictions += 1
+
+    def _release(self, key, shm: SharedMemory) -> None:
+        """Drops this process's hold on `key` and closes the mapping once unused."""
+        with self._registry_lock:
+            entry = self._registry.get(key)
+            if entry is not None and entry["state"] == "ready":
+                pid = os.getpid()
+                entry["holders"][pid] = entry["holders"].get(pid, 0) - 1
+                if entry["holders"][pid] <= 0:
+                    del entry["holders"][pid]
+                self._registry[key] = entry
+                self._evict_shared()
+        # Event tensors handed out earlier may still view the mapping
+        self._unclosed.append(shm)
+        still_open = []
+        for segment in self._unclosed:
+            try:
+                segment.close()
+            except BufferError:
+                still_open.append(segment)
+        self._unclosed = still_open
+
+    def _evict_shared(self) -> None:
+        """Unlinks shards no live process holds, least recently used first, until the node
+        budget is met.
+
+        Called with the registry lock held.
+        """
+        entries = {
+            key: entry
+            for key, entry in self._registry.items()
+            if entry["state"] == "ready"
+        }
+        pids = {pid for entry in entries.values() for pid in entry["holders"]}
+        dead = {pid for pid in pids if not self._alive(pid)}
+        for key, entry in entries.items():
+            if dead.intersection(entry["holders"]):
+                # ✅ Holds of processes that exited without releasing them
+                entry["holders"] = {
+                    pid: count
+                    for pid, count in entry["holders"].items()
+                    if pid not in dead
+                }
+                self._registry[key] = entry
+        total = sum(entry["nbytes"] for entry in entries.values())
+        unused = sorted(
+            (entry["last_used"], key)
+            for key, entry in entries.items()
+            if not entry["holders"]
+        )
+        for _, key in unused:
+            if total <= self.max_bytes:
+                break
+            self._unlink(entries[key]["name"])
+            del self._registry[key]
+            total -= entries[key]["nbytes"]
+
+    @staticmethod
+    def _unlink(name: str) -> None:
+        try:
+            shm = SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+    def _release_at_exit(self) -> None:
+        """Gives a worker's holds back as it exits.
+
+        A SIGTERM (DataLoader or Pool shutdown) arriving meanwhile is deferred until
+        the registry lock is free again; a worker killed while holding it would stall
+        every other process. Reader threads may receive the signal too, so it is
+        handled rather than masked.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            self.clear()
+            return
+        terminated = []
+        previous = signal.signal(
+            signal.SIGTERM, lambda signum, frame: terminated.append(signum)
+        )
+        try:
+            self.clear()
+        except (OSError, EOFError):
+            pass  # the manager already stopped
+        finally:
+            signal.signal(
+                signal.SIGTERM, previous if previous is not None else signal.SIG_DFL
+            )
+            if terminated:
+                os.kill(os.getpid(), signal.SIGTERM)
+
+    def clear(self) -> None:
+        """Unmaps this process's shards; segments stay for the other processes."""
+        with self._lock:
+            while self._shards:
+                key, _ = self._shards.popitem(last=False)
+                self._release(key, self._segments.pop(key))
+
+    def close(self) -> None:
+        """Unlinks every segment and stops the registry (main process only)."""
+        if os.getpid() != self._owner_pid or self._manager is None:
+            return
+        self.clear()
+        try:
+            with self._registry_lock:
+                # Loads still running find the cache closed and unlink their segment
+                self._closed.value = True
+                for entry in self._registry.values():
+                    self._unlink(entry["name"])
+                self._registry.clear()
+        except (OSError, EOFError):
+            pass  # the manager already stopped at interpreter exit
+        self._manager.shutdown()
+        self._manager = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._registry_lock:
+            entries = [e for e in self._registry.values() if e["state"] == "ready"]
+        stats["shared_shards"] = len(entries)
+        stats["shared_bytes"] = sum(entry["nbytes"] for entry in entries)
+        return stats
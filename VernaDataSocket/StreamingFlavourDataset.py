@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pyarrow.parquet as pq
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from .EventIndex import EventIndex
+from .FeatureShardCache import FeatureShardCache
+from .FeatureSchema import FeatureSchema
+from .MonoFlavourDataset import MonoFlavourDataset
+from .Selection import Selection
+from Enum.EnergyRange import EnergyRange
+from Enum.Flavour import Flavour
+from Enum.ClassificationMode import ClassificationMode
+
+
+class StreamingFlavourDataset(IterableDataset):
+    """Streams every event of whole truth directories without building a global index.
+
+    The truth files of all directories (each in part order) are dealt out to the
+    DataLoader workers, file i to worker i % num_workers. A worker indexes one truth
+    file at a time, walks its events shard by shard through the feature cache and
+    yields (features, target, analysis truth) as MonoFlavourDataset does, reading
+    ahead the next shards of that same walk. Memory is one truth file's index plus
+    the cache budget, and for CORSIKA the deduplication below.
+
+    Events with NaN features are skipped (the shard read reports them), since a
+    stream cannot stop over them the way an indexed evaluation does. CORSIKA events
+    repeat across truth files; as in NoiseDataset only the first occurrence of an
+    event_no (in part order) is yielded, for which a worker reads the event_no
+    column of the earlier CORSIKA truth files and keeps the event_nos it has seen,
+    which grow with the CORSIKA directory rather than with one file.
+    """
+
+    IDENTIFICATION = MonoFlavourDataset.IDENTIFICATION
+    ANALYSIS = MonoFlavourDataset.ANALYSIS
+    REQUIRED_COLUMNS = MonoFlavourDataset.REQUIRED_COLUMNS
+    CORSIKA_SUBDIRECTORY = "0003000-0003999"  # as read by NoiseDataset
+
+    # ✅ Targets are encoded exactly as in the map-style datasets
+    _encode_targets = MonoFlavourDataset._encode_targets
+    _encode_target = MonoFlavourDataset._encode_target
+    _encode_target_multiflavour = MonoFlavourDataset._encode_target_multiflavour
+    _encode_target_track_cascade_binary = (
+        MonoFlavourDataset._encode_target_track_cascade_binary
+    )
+    _encode_target_signal_noise_binary = (
+        MonoFlavourDataset._encode_target_signal_noise_binary
+    )
+
+    def __init__(
+        self,
+        truth_file_dirs: list,
+        classification_mode: ClassificationMode = ClassificationMode.MULTIFLAVOUR,
+        selection=None,
+        feature_cache_bytes: int = None,
+        prefetch_shards: int = 0,
+    ) -> None:
+        self.truth_file_dirs = list(truth_file_dirs)
+        self.classification_mode = classification_mode
+        self.selection = Selection.from_config(selection)
+        self.feature_cache_bytes = feature_cache_bytes
+        self.prefetch_shards = prefetch_shards
+
+        # Only file names are listed up front; no truth file is opened
+        self.truth_files = []
+        self.dedup_start = []  # per file, first file id of its CORSIKA directory
+        for truth_file_dir in self.truth_file_dirs:
+            truth_files = [
+                os.path.join(truth_file_dir, f)
+                for f in os.listdir(truth_file_dir)
+                if f.startswith("truth_") and f.endswith(".parquet")
+            ]
+            truth_files = sorted(
+                [f for f in truth_files if EventIndex.part_number(f) != float("inf")],
+                key=EventIndex.part_number,
+            )
+            corsika = os.path.basename(truth_file_dir) == self.CORSIKA_SUBDIRECTORY
+            start = len(self.truth_files) if corsika else None
+            self.truth_files += truth_files
+            self.dedup_start += [start] * len(truth_files)
+        self.read_columns = None
+        if self.selection.columns is not None:
+            self.read_columns = self.feature_schema().shard_column_names
+
+    @classmethod
+    def from_energy_range(
+        cls,
+        root_dir: str,
+        er: EnergyRange,
+        classification_mode: ClassificationMode = ClassificationMode.MULTIFLAVOUR,
+        root_dir_corsika: str = None,
+        **kwargs,
+    ) -> "StreamingFlavourDataset":
+        """Streams the flavours of `classification_mode` (and CORSIKA noise when it
+        separates signal from noise), as MultiFlavourDataset selects them."""
+        flavours = [Flavour.E, Flavour.MU, Flavour.TAU]
+        if classification_mode == ClassificationMode.TRACK_CASCADE_BINARY:
+            flavours = [Flavour.E, Flavour.MU]
+        truth_file_dirs = [
+            os.path.join(root_dir, f"{EnergyRange.get_subdir(er, flavour)}")
+            for flavour in flavours
+        ]
+        if classification_mode == ClassificationMode.SIGNAL_NOISE_BINARY:
+            truth_file_dirs.append(
+                os.path.join(root_dir_corsika, cls.CORSIKA_SUBDIRECTORY)
+            )
+        return cls(truth_file_dirs, classification_mode, **kwargs)
+
+    @staticmethod
+    def feature_file(truth_file: str, shard_no: int) -> str:
+        """Path of PMTfied shard `shard_no` of `truth_file`."""
+        part_no = int(os.path.basename(truth_file).split("_")[1].split(".")[0])
+        feature_dir = os.path.join(os.path.dirname(truth_file), str(part_no))
+        return os.path.join(feature_dir, f"PMTfied_{shard_no}.parquet")
+
+    def feature_schema(self) -> FeatureSchema:
+        """Column layout of the features as read, from the footer of the first shard."""
+        first_index = EventIndex.scan_truth_file(
+            self.truth_files, 0, self.REQUIRED_COLUMNS
+        )
+        schema = FeatureSchema.from_file(
+            self.feature_file(self.truth_files[0], int(first_index.shard_no[0]))
+        )
+        if self.selection.columns is None:
+            return schema
+        return schema.select(self.selection.columns)
+
+    def _worker_files(self) -> list:
+        worker_info = get_worker_info()
+        file_ids = range(len(self.truth_files))
+        if worker_info is None:
+            return list(file_ids)
+        return list(file_ids[worker_info.id :: worker_info.num_workers])
+
+    def _event_nos(self, file_id: int) -> np.ndarray:
+        """event_nos of the selected events of one truth file, from the truth columns only."""
+        columns = ["event_no"] + [
+            col for col in self.selection.truth_columns if col != "event_no"
+        ]
+        truth_table = pq.read_table(
+            self.truth_files[file_id], columns=columns, memory_map=True
+        )
+        event_nos = truth_table.column("event_no").to_numpy()
+        if self.selection.truth_ranges:
+            event_nos = event_nos[self.selection.mask(truth_table)]
+        return event_nos
+
+    def _first_occurrences(
+        self, events: EventIndex, file_id: int, seen: dict
+    ) -> EventIndex:
+        """Drops the events of a CORSIKA truth file seen earlier in it or in an earlier file.
+
+        `seen` maps a directory's first file id to (next file id to fold in, sorted
+        event_nos of the files before it) and is advanced as the worker goes.
+        """
+        start = self.dedup_start[file_id]
+        next_id, earlier = seen.get(start, (start, np.empty(0, dtype=np.int64)))
+        for earlier_id in range(next_id, file_id):
+            earlier = np.union1d(earlier, self._event_nos(earlier_id))
+        seen[start] = (file_id + 1, np.union1d(earlier, events.event_no))
+
+        _, first = np.unique(events.event_no, return_index=True)
+        first = np.sort(first)  # ✅ file order
+        return events.take(first[~np.isin(events.event_no[first], earlier)])
+
+    def __iter__(self):
+        cache = FeatureShardCache.instance(self.feature_cache_bytes)
+        columns = self.IDENTIFICATION + self.ANALYSIS
+        seen = {}
+        for file_id in self._worker_files():
+            events = EventIndex.scan_truth_file(
+                self.truth_files, file_id, self.REQUIRED_COLUMNS, self.selection
+            )
+            if self.dedup_start[file_id] is not None:
+                events = self._first_occurrences(events, file_id, seen)
+            targets = self._encode_targets(events.pid)
+            truth_file = self.truth_files[file_id]
+            # ✅ One shard order for both the reads and the read-ahead
+            shards = events.group_by_shard(np.arange(len(events)))
+            feature_files = [
+                self.feature_file(truth_file, int(events.shard_no[positions[0]]))
+                for positions in shards
+            ]
+            for shard_idx, positions in enumerate(shards):
+                if self.prefetch_shards:
+                    cache.prefetch(
+                        feature_files[
+                            shard_idx + 1 : shard_idx + 1 + self.prefetch_shards
+                        ],
+                        self.read_columns,
+                    )
+                shard = cache.get(feature_files[shard_idx], self.read_columns)
+                offsets, N_doms = events.offset[positions], events.N_doms[positions]
+                valid = shard.valid_events(offsets, N_doms)
+                analysis_truth = events.analysis_truth(positions, columns)
+                for i, position in enumerate(positions):
+                    if not valid[i]:
+                        continue
+                    features = torch.from_numpy(shard.event(offsets[i], N_doms[i]))
+                    yield features, targets[position], analysis_truth[i]
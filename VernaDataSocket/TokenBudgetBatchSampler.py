@@ -0,0 +1,127 @@
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """Packs events into batches bounded by a token or attention-cost budget.
+
+    `lengths` are the per-event sequence lengths (N_doms capped at event_length, from
+    the event index). A batch is charged as it is padded, B x its longest length: it
+    is closed before B x max_len would exceed `max_tokens`, or B x max_len**2 would
+    exceed `max_attention_cost`; an event over budget on its own gets a batch to
+    itself. The budget bounds the padded tensor only when batches are padded to
+    their longest event (dynamic padding) or packed.
+
+    Every epoch, positions come from `sampler` (sequential, or a ShardLocalitySampler
+    seeded with seed + epoch) in chunks of `chunk_size`, and each chunk is sorted by
+    length and packed, so the batches themselves change with the sampler's order
+    while the open feature shards stay those of one chunk. The number of batches is
+    kept at that of epoch 0 (as OneCycleLR needs): an epoch that packs into more
+    batches packs neighbouring chunks together, one that packs into fewer splits its
+    largest batches, neither of which exceeds the budget. With `shuffle` the batch
+    order within each chunk changes every epoch too.
+    """
+
+    def __init__(
+        self,
+        sampler,
+        lengths: np.ndarray,
+        max_tokens: int = None,
+        max_attention_cost: int = None,
+        chunk_size: int = 8192,
+        shuffle: bool = False,
+        seed: int = 42,
+    ) -> None:
+        if max_tokens is None and max_attention_cost is None:
+            raise ValueError("Set max_tokens, max_attention_cost or both.")
+        self.sampler = sampler
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.max_attention_cost = max_attention_cost
+        self.chunk_size = max(1, chunk_size)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.n_batches = sum(len(batches) for batches in self._pack_epoch(0))
+
+    def _pack(self, positions: np.ndarray) -> list:
+        """Greedy packing of `positions`, sorted by length, under the budgets.
+
+        Lengths are visited in ascending order, so the event being added is the
+        longest of the batch and sets the padded length of every event before it.
+        """
+        positions = positions[np.argsort(self.lengths[positions], kind="stable")]
+        max_tokens = self.max_tokens if self.max_tokens is not None else np.inf
+        max_cost = (
+            self.max_attention_cost if self.max_attention_cost is not None else np.inf
+        )
+        batches, batch_start = [], 0
+        for i, length in enumerate(self.lengths[positions].tolist()):
+            batch_size = i - batch_start + 1
+            over_budget = (
+                batch_size * length > max_tokens or batch_size * length**2 > max_cost
+            )
+            if over_budget and i > batch_start:
+                batches.append(positions[batch_start:i])
+                batch_start = i
+        if batch_start < len(positions):
+            batches.append(positions[batch_start:])
+        return batches
+
+    def _pack_epoch(self, epoch: int) -> list:
+        """Per chunk of the sampler's order for `epoch`, the packed batches of positions."""
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+        positions = np.fromiter(iter(self.sampler), dtype=np.int64)
+        return [
+            self._pack(positions[start : start + self.chunk_size])
+            for start in range(0, len(positions), self.chunk_size)
+        ]
+
+    def _fix_batch_count(self, chunks: list) -> list:
+        """Brings the batches of an epoch to `n_batches` without exceeding the budget.
+
+        Packing all events at once needs the fewest batches, which is at most
+        `n_batches`, so merging neighbouring chunks always gets there.
+        """
+        while len(chunks) > 1 and (
+            sum(len(batches) for batches in chunks) > self.n_batches
+        ):
+            sizes = [
+                sum(len(batch) for batch in chunks[i] + chunks[i + 1])
+                for i in range(len(chunks) - 1)
+            ]
+            i = int(np.argmin(sizes))
+            merged = np.concatenate(chunks[i] + chunks[i + 1])
+            chunks[i : i + 2] = [self._pack(merged)]
+        while sum(len(batches) for batches in chunks) < self.n_batches:
+            # Part of a batch within budget is within budget
+            chunk_idx, batch_idx = max(
+                (
+                    (c, b)
+                    for c, batches in enumerate(chunks)
+                    for b in range(len(batches))
+                ),
+                key=lambda cb: len(chunks[cb[0]][cb[1]]),
+            )
+            batch = chunks[chunk_idx][batch_idx]
+            half = len(batch) // 2
+            chunks[chunk_idx][batch_idx : batch_idx + 1] = [batch[:half], batch[half:]]
+        return chunks
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.n_batches
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        chunks = self._fix_batch_count(self._pack_epoch(self.epoch))
+        self.epoch += 1
+        for batches in chunks:
+            batch_order = (
+                rng.permutation(len(batches)) if self.shuffle else range(len(batches))
+            )
+            for batch_idx in batch_order:
+                yield batches[batch_idx].tolist()
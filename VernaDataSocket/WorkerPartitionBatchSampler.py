@@ -0,0 +1,121 @@
+import numpy as np
+from torch.utils.data import Sampler, Subset, get_worker_info
+from .ShardLocalitySampler import ShardLocalitySampler
+from .FeatureShardCache import FeatureShardCache
+
+
+class WorkerPartitionBatchSampler(Sampler):
+    """Batches a MultiFlavourDataset (or a Subset of it) so DataLoader workers read disjoint shards.
+
+    A map-style DataLoader hands batch i to worker i % num_workers. Each flavour's
+    events (in index order, i.e. shard by shard) are split into `num_workers`
+    contiguous ranges of equal size, worker w gets range w of every flavour (which
+    keeps the class balance), and the batches of all workers are interleaved in
+    dispatch order. Every shard is then read, and cached, by a single worker, apart
+    from at most one shard per range boundary. With `shuffle` each worker's range is
+    shuffled by its own ShardLocalitySampler. Only whole batches are dispatched per
+    worker; the workers' leftover events are carried into the final batch(es) of
+    the epoch, so there is one short batch at most.
+    """
+
+    def __init__(
+        self,
+        data_source,
+        batch_size: int,
+        num_workers: int,
+        shuffle: bool = False,
+        window_shards: int = 8,
+        seed: int = 42,
+    ) -> None:
+        if isinstance(data_source, Subset):
+            dataset, indices = data_source.dataset, np.asarray(data_source.indices)
+        else:
+            dataset, indices = data_source, np.arange(len(data_source))
+        self.batch_size = batch_size
+        self.num_workers = max(1, num_workers)
+        self.shuffle = shuffle
+        self.window_shards = window_shards
+        self.seed = seed
+        self.epoch = 0
+
+        # Positions are relative to `data_source`, which is what the DataLoader indexes
+        self.flavours, self.groups = dataset.shard_groups(indices)
+        self.worker_positions = self._partition()
+        self.worker_samplers = [
+            ShardLocalitySampler(
+                Subset(dataset, indices[positions]),
+                window_shards=window_shards,
+                seed=seed + worker_id,
+            )
+            for worker_id, positions in enumerate(self.worker_positions)
+        ]
+
+    def _partition(self) -> list:
+        """Splits every flavour's events into `num_workers` contiguous, equal ranges."""
+        worker_streams = [[] for _ in range(self.num_workers)]
+        for flavour in np.unique(self.flavours):
+            positions = np.flatnonzero(self.flavours == flavour)
+            # Equal counts keep the workers' batches aligned with the dispatch order
+            cuts = np.round(
+                np.arange(self.num_workers + 1) * len(positions) / self.num_workers
+            ).astype(np.int64)
+            for worker_id in range(self.num_workers):
+                worker_streams[worker_id].append(
+                    positions[cuts[worker_id] : cuts[worker_id + 1]]
+                )
+        return [
+            ShardLocalitySampler.merge_by_progress(streams)
+            for streams in worker_streams
+        ]
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _worker_batches(self, worker_id: int) -> tuple:
+        """Whole batches of one worker's range, and the positions left over."""
+        positions = self.worker_positions[worker_id]
+        if self.shuffle:
+            sampler = self.worker_samplers[worker_id]
+            sampler.set_epoch(self.epoch)
+            positions = positions[np.fromiter(iter(sampler), dtype=np.int64)]
+        n_whole = len(positions) // self.batch_size * self.batch_size
+        batches = [
+            positions[i : i + self.batch_size].tolist()
+            for i in range(0, n_whole, self.batch_size)
+        ]
+        return batches, positions[n_whole:]
+
+    def __len__(self) -> int:
+        n_whole = sum(
+            len(positions) // self.batch_size for positions in self.worker_positions
+        )
+        n_left = sum(
+            len(positions) % self.batch_size for positions in self.worker_positions
+        )
+        return n_whole + -(-n_left // self.batch_size)
+
+    def __iter__(self):
+        worker_batches, leftovers = zip(
+            *[self._worker_batches(worker_id) for worker_id in range(self.num_workers)]
+        )
+        self.epoch += 1
+        for step in range(max(len(batches) for batches in worker_batches)):
+            for batches in worker_batches:
+                if step < len(batches):
+                    yield batches[step]
+        # ✅ Leftovers of all workers close the epoch together
+        leftovers = np.concatenate(leftovers)
+        for i in range(0, len(leftovers), self.batch_size):
+            yield leftovers[i : i + self.batch_size].tolist()
+
+    @staticmethod
+    def worker_init_fn(worker_id: int) -> None:
+        """Gives every worker an equal share of the feature cache budget."""
+        if FeatureShardCache.instance().SHARED:
+            return  # one budget for the whole node
+        info = get_worker_info()
+        dataset = info.dataset
+        if isinstance(dataset, Subset):
+            dataset = dataset.dataset
+        budget = dataset.feature_cache_bytes or FeatureShardCache.DEFAULT_MAX_BYTES
+        dataset.set_feature_cache_bytes(budget // info.num_workers)
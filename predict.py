@@ -5,6 +5,7 @@ import os
 import torch
 import logging
 import argparse
+import numpy as np
 import pandas as pd
 from pytorch_lightning import Trainer
 
@@ -14,7 +15,7 @@ from Model.FlavourClassificationTransformerEncoder import (
     FlavourClassificationTransformerEncoder,
 )
 from VernaDataSocket.MultiFlavourDataModule import MultiFlavourDataModule
-from VernaDataSocket.MonoFlavourDataset import MonoFlavourDataset
+from VernaDataSocket.MultiFlavourDataset import MultiFlavourDataset
 from Enum.EnergyRange import EnergyRange
 from Enum.Flavour import Flavour
 from Enum.ClassificationMode import ClassificationMode
@@ -143,8 +144,8 @@ def load_model_config(dirs, checkpoint_date, checkpoint_time):
     return config
 
 
-def build_model(config: dict, device: torch.device, ckpt_file: str):
-    """Load model from checkpoint."""
+def build_model(config: dict, device: torch.device, ckpt_file: str, d_input: int):
+    """Load model from checkpoint; `d_input` is the feature width the datamodule reads."""
     classification_mode = ClassificationMode.from_string(config["classification_mode"])
     num_classes = classification_mode.num_classes
     attention_type = AttentionType.from_string(config["attention"])
@@ -159,7 +160,7 @@ def build_model(config: dict, device: torch.device, ckpt_file: str):
         n_heads=config["n_heads"],
         d_f=config["embedding_dim"] * 4,
         num_layers=config["n_layers"],
-        d_input=config["d_input"],
+        d_input=d_input,
         n_output_layers=config["n_output_layers"],
         num_classes=num_classes,
         seq_len=config["event_length"],
@@ -193,6 +194,18 @@ def build_data_module(
         frac_test=config["frac_test"],
         classification_mode=classification_mode,
         root_dir_corsika=root_dir_corsika,
+        selection=config.get("selection"),
+        index_cache_dir=config.get("index_cache_dir"),
+        index_threads=config.get("index_threads"),
+        feature_cache_bytes=config.get("feature_cache_bytes"),
+        shared_feature_cache=config.get("shared_feature_cache", False),
+        preprocessed_dir=config.get("preprocessed_dir"),
+        prefetch_shards=config.get("prefetch_shards", 0),
+        whole_shard_reads=config.get("whole_shard_reads", False),
+        carry_analysis=config.get("carry_analysis", True),
+        dynamic_padding=config.get("dynamic_padding", False),
+        packed=config.get("packed", False),
+        streaming=config.get("streaming", False),
     )
     datamodule.setup(stage="predict")
     return datamodule
@@ -314,15 +327,14 @@ def build_predictions(
 
 
 def build_analysis_df(test_dataset):
-    """Extracts the analysis columns from the unbatched dataset (no collate interference)."""
-    analysis_list = []
+    """Extracts the analysis columns of the test subset from the event index (no feature reads)."""
+    return test_dataset.dataset.analysis_frame(test_dataset.indices)
 
-    for idx in range(len(test_dataset)):
-        _, _, analysis = test_dataset[idx]
-        analysis_list.append(list(analysis))
 
-    analysis_columns = MonoFlavourDataset.IDENTIFICATION + MonoFlavourDataset.ANALYSIS
-    return pd.DataFrame(analysis_list, columns=analysis_columns)
+def build_carried_analysis_df(predictions: list):
+    """Joins the analysis truth carried through the prediction batches, in prediction order."""
+    analysis = np.concatenate([batch["analysis"] for batch in predictions])
+    return pd.DataFrame(analysis, columns=MultiFlavourDataset.ANALYSIS_COLUMNS)
 
 
 def save_predictions(
@@ -475,7 +487,15 @@ def run_prediction(
     specific_checkpoint_dir = dirs["checkpoint_dir"]
     ckpt_files = [f for f in os.listdir(specific_checkpoint_dir) if f.endswith(".ckpt")]
 
-    df_analysis = build_analysis_df(datamodule.test_dataloader().dataset)
+    # ✅ Streaming scores whole directories; otherwise the test split is scored
+    if datamodule.streaming:
+        predict_dataloader = datamodule.predict_dataloader
+    else:
+        predict_dataloader = datamodule.test_dataloader
+
+    # ✅ With carry_analysis the truth comes with the predictions, in the same pass
+    if not datamodule.carry_analysis:
+        df_analysis = build_analysis_df(datamodule.test_dataset)
 
     summary_metrics = []
 
@@ -488,13 +508,16 @@ def run_prediction(
 
         try:
             print(f"\n🔥 Loading model from {ckpt_file}...")
-            model = build_model(config=config, device=device, ckpt_file=ckpt_file_dir)
+            model = build_model(
+                config=config,
+                device=device,
+                ckpt_file=ckpt_file_dir,
+                d_input=datamodule.feature_schema.d_input,  # ✅ after column selection
+            )
             model.to(device)
 
             print("🚀 Running predictions...")
-            predictions = trainer.predict(
-                model=model, dataloaders=datamodule.test_dataloader()
-            )
+            predictions = trainer.predict(model=model, dataloaders=predict_dataloader())
 
             print("💾 Saving predictions...")
             df_predictions = build_predictions(
@@ -503,6 +526,8 @@ def run_prediction(
                 prediction_dir=dirs["predict_dir"],
                 ckpt_file=ckpt_file_dir,
             )
+            if datamodule.carry_analysis:
+                df_analysis = build_carried_analysis_df(predictions)
 
             df_combined = save_predictions(
                 df_predictions=df_predictions,
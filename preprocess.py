@@ -0,0 +1,106 @@
+import time
+import json
+import os
+import argparse
+
+from VernaDataSocket.MonoFlavourDataset import MonoFlavourDataset
+from VernaDataSocket.NoiseDataset import NoiseDataset
+from VernaDataSocket.PreprocessedFlavourDataset import PreprocessedFlavourDataset
+from Enum.EnergyRange import EnergyRange
+from Enum.Flavour import Flavour
+
+import sys
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Converts PMTfied selections into preprocessed feature stores"
+    )
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        required=True,
+        help="Directory of the stores, used as `preprocessed_dir` in the config",
+    )
+    parser.add_argument(
+        "--chunk_size", type=int, default=4096, help="Events converted per step"
+    )
+    return parser.parse_args()
+
+
+def run_preprocessing(
+    config_file: str,
+    data_root_dir: str,
+    data_root_dir_corsika: str,
+    er: EnergyRange,
+):
+    args = parse_args()
+    with open(config_file, "r") as f:
+        config = json.load(f)
+
+    flavour_event_map = {
+        Flavour.E: config["N_events_nu_e"],
+        Flavour.MU: config["N_events_nu_mu"],
+        Flavour.TAU: config["N_events_nu_tau"],
+    }
+    for flavour, N_events in flavour_event_map.items():
+        dataset = MonoFlavourDataset(
+            root_dir=data_root_dir,
+            er=er,
+            flavour=flavour,
+            N_events_monodataset=N_events,
+            selection=config.get("selection"),
+            index_cache_dir=config.get("index_cache_dir"),
+            index_threads=config.get("index_threads"),
+            feature_cache_bytes=config.get("feature_cache_bytes"),
+        )
+        PreprocessedFlavourDataset.write(
+            dataset,
+            PreprocessedFlavourDataset.store_dir_for(args.out_dir, er, flavour),
+            chunk_size=args.chunk_size,
+        )
+
+    if config["N_events_noise"] > 0:
+        noise_dataset = NoiseDataset(
+            root_dir=data_root_dir_corsika,
+            N_events_noise=config["N_events_noise"],
+            selection=config.get("selection"),
+            index_cache_dir=config.get("index_cache_dir"),
+            index_threads=config.get("index_threads"),
+            feature_cache_bytes=config.get("feature_cache_bytes"),
+        )
+        PreprocessedFlavourDataset.write(
+            noise_dataset,
+            PreprocessedFlavourDataset.store_dir_for(args.out_dir, er),
+            chunk_size=args.chunk_size,
+        )
+
+
+if __name__ == "__main__":
+    training_dir = os.path.dirname(os.path.realpath(__file__))
+    config_dir = os.path.join(training_dir, "config")
+
+    config_file = "config.json"
+
+    data_root_dir = "/lustre/hpc/project/icecube/HE_Nu_Aske_Oct2024/PMTfied_filtered_second_round/Snowstorm/CC_CRclean_Contained"
+    data_root_dir_corsika = "/lustre/hpc/project/icecube/HE_Nu_Aske_Oct2024/PMTfied_second/Corsika_Contained"
+
+    er = EnergyRange.ER_100_TEV_100_PEV
+
+    print(f"data_root_dir: {data_root_dir}")
+    print(f"data_root_dir_corsika: {data_root_dir_corsika}")
+    print(f"energy range: {er.string}")
+
+    start_time = time.time()
+    run_preprocessing(
+        config_file=os.path.join(config_dir, config_file),
+        data_root_dir=data_root_dir,
+        data_root_dir_corsika=data_root_dir_corsika,
+        er=er,
+    )
+    end_time = time.time()
+    print(
+        f"Preprocessing completed in {time.strftime('%d:%H:%M:%S', time.gmtime(end_time - start_time))}"
+    )
@@ -178,8 +178,9 @@ def setup_directories(
 def build_model(
     config: dict,
     device: torch.device,
+    d_input: int,
 ):
-    """Build and return the model."""
+    """Build and return the model; `d_input` is the feature width the datamodule reads."""
     classification_mode = ClassificationMode.from_string(config["classification_mode"])
     num_classes = classification_mode.num_classes
     attention_type = AttentionType.from_string(config["attention"])
@@ -192,7 +193,7 @@ def build_model(
         n_heads=config["n_heads"],
         d_f=config["embedding_dim"] * 4,
         num_layers=config["n_layers"],
-        d_input=config["d_input"],
+        d_input=d_input,
         n_output_layers=config["n_output_layers"],
         num_classes=num_classes,
         seq_len=config["event_length"],
@@ -225,6 +226,23 @@ def build_data_module(
         frac_test=config["frac_test"],
         classification_mode=classification_mode,
         root_dir_corsika=root_dir_corsika,
+        selection=config.get("selection"),
+        index_cache_dir=config.get("index_cache_dir"),
+        index_threads=config.get("index_threads"),
+        feature_cache_bytes=config.get("feature_cache_bytes"),
+        shared_feature_cache=config.get("shared_feature_cache", False),
+        preprocessed_dir=config.get("preprocessed_dir"),
+        prefetch_shards=config.get("prefetch_shards", 0),
+        whole_shard_reads=config.get("whole_shard_reads", True),
+        shuffle=config.get("shuffle", False),
+        shuffle_window_shards=config.get("shuffle_window_shards", 8),
+        bucket_by_length=config.get("bucket_by_length", False),
+        bucket_batches=config.get("bucket_batches", 50),
+        dynamic_padding=config.get("dynamic_padding", False),
+        packed=config.get("packed", False),
+        partition_workers=config.get("partition_workers", False),
+        max_tokens=config.get("max_tokens"),
+        max_attention_cost=config.get("max_attention_cost"),
     )
     datamodule.setup(stage="fit")
     return datamodule
@@ -345,6 +363,7 @@ def run_training(
     model = build_model(
         config=config,
         device=device,
+        d_input=datamodule.feature_schema.d_input,  # ✅ after column selection
     )
 
     # ✅ Build Optimizer (after DataModule setup to get train_dataloader_length)